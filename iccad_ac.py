@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""For demonstrating AC analysis (frequency sweep) of a linear circuit of
+R, Z, C, L elements and independent sources, based on the MNA matrix of
+iccad_mna.py. In frequency domain, the MNA equation reads
+    (A + jw * E) * X = Z
+where A is the frequency-independent part (resistors, Z elements and
+v-source/inductor branches) and E is the frequency-dependent part
+(capacitors, and inductors on their branch equations). Both parts are
+stamped only once; each frequency point just adds them up and solves.
+The frequency points are independent of each other, so they are spread
+across a pool of worker processes.
+"""
+
+import sys
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import iccad_mna as mna
+from spice_parse import spiceValue
+
+
+class ACSystem:
+    """The two parts of the frequency-domain MNA matrix, on one merged
+       list of unique (row, column) positions, and the AC excitation
+       ---
+       + rows/cols are the matrix positions of nonzero entries, in CSC
+         order, and indptr marks where each column starts in them
+       + valA/valE are the values of A and E on these positions
+       + rhs is the right hand side vector Z of AC excitations
+    """
+
+    def __init__(self, ckt):
+        self.N = ckt.N
+        self.size = ckt.N + ckt.M
+        rowA, colA, valA, self.rhs = mna.stampTriplets(ckt, ckt.acValue())
+        rowE, colE, valE = mna.stampReactive(ckt)
+
+        # Sum up repeated positions once here, instead of on every
+        # frequency point; both parts then share one position list,
+        # sorted column by column, i.e. in CSC (compressed sparse column)
+        # order, so each point just fills in the CSC data array
+        keys = np.concatenate((colA, colE)) * self.size \
+            + np.concatenate((rowA, rowE))
+        (uniqueKeys, where) = np.unique(keys, return_inverse=True)
+        self.rows = uniqueKeys % self.size
+        self.cols = uniqueKeys // self.size
+        count = len(uniqueKeys)
+        self.valA = mna.scatterSum(where[:len(valA)],
+                                   valA.astype(complex), count)
+        self.valE = mna.scatterSum(where[len(valA):],
+                                   valE.astype(complex), count)
+        self.indptr = np.searchsorted(self.cols, np.arange(self.size + 1))
+
+    def solve(self, freq):
+        """Solve the MNA equation on one frequency point (in Hz)
+        """
+        omega = 2 * np.pi * freq
+        data = self.valA + 1j * omega * self.valE
+        if mna.sp is None or self.size <= mna.DENSE_SIZE_LIMIT:
+            A = np.zeros([self.size, self.size], dtype=complex)
+            A[self.rows, self.cols] = data
+            return np.linalg.solve(A, self.rhs)
+        A = mna.sp.csc_matrix((data, self.rows, self.indptr),
+                              shape=(self.size, self.size))
+        return mna.spla.splu(A).solve(self.rhs)
+
+    def solveFrequencies(self, freqs):
+        """Solve a row of solution for each frequency point in freqs
+        """
+        return np.array([self.solve(f) for f in freqs]).reshape(
+            len(freqs), self.size)
+
+
+# Sweeps with fewer (matrix size x frequency points) than this are
+# solved in this process when the number of processes is not given
+POOL_MIN_WORK = 200000
+
+# The ACSystem of a worker process, which is handed over only once per
+# worker by the pool initializer, not once per frequency chunk
+workerSystem = None
+
+
+def initWorker(acSystem):
+    global workerSystem
+    workerSystem = acSystem
+
+
+def solveChunk(freqs):
+    return workerSystem.solveFrequencies(freqs)
+
+
+class ACResult:
+    """Result of ac_sweep(), kept as complex NumPy arrays with one row per
+       frequency point
+       ---
+       + freqs[f] is the frequency (Hz) of point f
+       + nodeVolt[f, nodeDict[name]] is the voltage phasor of node 'name'
+       + vsrcCurr[f, vsrcDict[name]] is the current phasor through
+         v-source (or inductor) 'name'
+    """
+
+    def __init__(self, freqs, nodeVolt, vsrcCurr, nodeDict, vsrcDict):
+        self.freqs = freqs
+        self.nodeVolt = nodeVolt
+        self.vsrcCurr = vsrcCurr
+        self.nodeDict = nodeDict
+        self.vsrcDict = vsrcDict
+
+
+def ac_sweep(ckt, freqs, processes=None):
+    """AC analysis of Circuit ckt on frequency points freqs (in Hz),
+       returning an ACResult. The points are solved by a pool of
+       'processes' worker processes; with processes=1 they are solved
+       one by one in this process. If processes is None, all CPU cores are
+       used, unless the sweep is too small (see POOL_MIN_WORK) to gain.
+    """
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+    acSystem = ACSystem(ckt)
+
+    if processes is None:
+        # starting worker processes costs more than a small sweep
+        if acSystem.size * len(freqs) < POOL_MIN_WORK:
+            processes = 1
+        else:
+            processes = os.cpu_count() or 1
+    processes = min(processes, len(freqs))
+
+    if processes <= 1:
+        X = acSystem.solveFrequencies(freqs)
+    else:
+        # a few chunks per worker keeps them all busy till the end
+        chunks = np.array_split(freqs, processes * 4)
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=initWorker,
+                                 initargs=(acSystem,)) as pool:
+            X = np.vstack(list(pool.map(solveChunk, chunks)))
+
+    N = ckt.N
+    return ACResult(freqs, X[:, :N], X[:, N:], ckt.nodeDict, ckt.vsrcDict)
+
+
+def acCardFreqs(ckt):
+    """Frequency points given by the .ac card of Circuit ckt, e.g.
+       '.ac dec 10 1 1meg', '.ac oct 5 1k 1g' or '.ac lin 100 1 100',
+       or None without any .ac card
+    """
+    for card in ckt.controls:
+        if card[0] == '.AC':
+            (mode, points) = (card[1], int(spiceValue(card[2])))
+            (fStart, fStop) = (spiceValue(card[3]), spiceValue(card[4]))
+            if mode == 'LIN':
+                return np.linspace(fStart, fStop, points)
+            # DEC and OCT give points per decade/octave
+            base = 10 if mode == 'DEC' else 2
+            count = int(np.floor(points * np.log(fStop / fStart)
+                                 / np.log(base) + 1e-9)) + 1
+            return fStart * base ** (np.arange(count) / points)
+    return None
+
+
+def main():
+    """Command line entry: AC sweep of a netlist file by its .ac card
+    """
+    parser = argparse.ArgumentParser(
+        description='%(prog)s: AC frequency sweep of a linear circuit')
+    parser.add_argument(
+        'netlist', help='input circuit file name')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: all CPU cores)')
+    parser.add_argument(
+        '-n', '--nodes', nargs='+', metavar='NODE',
+        help='nodes to print (default: all nodes)')
+    args = parser.parse_args()
+
+    ckt = mna.Circuit.fromFile(args.netlist)
+    freqs = acCardFreqs(ckt)
+    if freqs is None:
+        print("No .ac card found in %s" % args.netlist, file=sys.stderr)
+        sys.exit(1)
+
+    res = ac_sweep(ckt, freqs, processes=args.jobs)
+
+    # one row per frequency point: magnitude and phase(deg) of each node
+    nodes = [n.upper() for n in args.nodes] if args.nodes \
+        else list(res.nodeDict.keys())
+    columns = [res.nodeDict[n] for n in nodes]
+    print("FREQ", *["|V(%s)|\tPHASE(%s)" % (n, n) for n in nodes],
+          sep="\t")
+    for (f, volts) in zip(res.freqs, res.nodeVolt[:, columns]):
+        print("%.6g" % f, *["%.6g\t%.3f" % (abs(v), np.angle(v, deg=True))
+                            for v in volts], sep="\t")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""Benchmarks of the circuit simulation demos on generated netlists.
+Netlist generators write parametric circuits of any size:
+  + ladder: an R-R ladder (with a C on each rung node) driven by a V source
+  + mesh: a 2-D or 3-D resistor mesh, fed at one corner and loaded at the
+    opposite one, as the metal meshes of evalmesh.py
+  + cube: a lattice of unit cubes of 1 Ohm edges, test_circuits/cube.spice
+    grown in all 3 directions
+  + diodes: a chain of R-D stages, each clamping its node by a diode, for
+    iccad_newton.py
+The runner times each phase (parse, stamp, factor, solve for iccad_mna;
+parse and Newton iterations for iccad_newton) of every generator and
+size in a fresh process, so that the peak memory (max RSS) of each case
+is its own. Results are written as JSON or CSV, and the scaling exponent
+of each phase, i.e. b of time ~ a * size^b, is fitted by least squares
+on the log-log data.
+"""
+
+import sys
+import os
+import io
+import json
+import csv
+import time
+import resource
+import tempfile
+import tracemalloc
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import iccad_mna as mna
+import iccad_newton
+
+
+def ladderLines(nodes):
+    """Lines of a ladder netlist of about 'nodes' nodes: series 1 Ohm
+       resistors, each node shunted to ground by 10 Ohm and 1pF
+    """
+    yield "* R-R-C ladder of %d stages" % nodes
+    yield "V1 N0 0 1"
+    for i in range(1, nodes):
+        yield "RS%d N%d N%d 1" % (i, i - 1, i)
+        yield "RP%d N%d 0 10" % (i, i)
+        yield "C%d N%d 0 1P" % (i, i)
+
+
+def meshLines(nodes, dims=2):
+    """Lines of a 2-D (dims=2) or 3-D (dims=3) resistor mesh of about
+       'nodes' nodes, 1V on one corner and a 1mA load on the opposite one
+    """
+    n = max(2, int(round(nodes ** (1.0 / dims))))
+    shape = (n,) * dims
+    yield "* %s resistor mesh" % "x".join(str(s) for s in shape)
+    name = lambda idx: "N" + "_".join(str(i) for i in idx)
+    for idx in np.ndindex(*shape):
+        for axis in range(dims):
+            if idx[axis] + 1 < n:
+                nxt = list(idx)
+                nxt[axis] += 1
+                yield "R%d%s %s %s 1" % (axis, name(idx)[1:], name(idx),
+                                          name(nxt))
+    yield "V1 %s 0 1" % name((0,) * dims)
+    yield "I1 %s 0 1M" % name((n - 1,) * dims)
+
+
+def cubeLines(nodes):
+    """Lines of a lattice of unit cubes with 1 Ohm edges, of about 'nodes'
+       vertices, with 1V across its main diagonal as in cube.spice
+    """
+    n = max(2, int(round(nodes ** (1.0 / 3))))
+    yield "* %dx%dx%d cube lattice" % (n, n, n)
+    for (i, j, k) in np.ndindex(n, n, n):
+        for (di, dj, dk) in ((1, 0, 0), (0, 1, 0), (0, 0, 1)):
+            if i + di < n and j + dj < n and k + dk < n:
+                yield "R%d_%d_%d_%d%d%d V%d_%d_%d V%d_%d_%d 1" % (
+                    i, j, k, di, dj, dk, i, j, k, i + di, j + dj, k + dk)
+    yield "VNULL V%d_%d_%d 0 0" % (n - 1, n - 1, n - 1)
+    yield "V1 V0_0_0 0 1"
+
+
+def diodeLines(nodes):
+    """Lines of a chain of about 'nodes' R-D stages for iccad_newton.py:
+       each stage node is fed by 100 Ohm from the one before and clamped
+       to ground by a diode
+    """
+    yield "* chain of %d R-D stages" % nodes
+    yield "V1 N0 0 5"
+    for i in range(1, nodes):
+        yield "R%d N%d N%d 100" % (i, i - 1, i)
+        yield "D%d N%d 0 diode" % (i, i)
+
+
+GENERATORS = {'ladder': ladderLines,
+              'mesh2d': lambda nodes: meshLines(nodes, 2),
+              'mesh3d': lambda nodes: meshLines(nodes, 3),
+              'cube': cubeLines,
+              'diodes': diodeLines}
+
+
+def writeNetlist(fileName, lines):
+    with open(fileName, 'w') as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def peakMemory():
+    """Peak resident memory of this process so far, in MB
+    """
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KB elsewhere
+    return kb / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1.0)
+
+
+def benchMNA(fileName):
+    """Time the phases of iccad_mna on a netlist file
+    """
+    times = {}
+    t0 = time.perf_counter()
+    ckt = mna.Circuit.fromFile(fileName)
+    t1 = time.perf_counter()
+    (stampRow, stampCol, stampVal, vectorZ) = mna.stampTriplets(ckt)
+    t2 = time.perf_counter()
+    factor = mna.LUFactor(ckt.N + ckt.M, stampRow, stampCol, stampVal)
+    t3 = time.perf_counter()
+    factor.solve(vectorZ)
+    t4 = time.perf_counter()
+    times.update(parse=t1 - t0, stamp=t2 - t1, factor=t3 - t2,
+                 solve=t4 - t3, size=ckt.N + ckt.M, nodes=ckt.N)
+    return times
+
+
+def benchNewton(fileName):
+    """Time the phases of iccad_newton on a netlist file; its per
+       iteration printing is dropped
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        newton = iccad_newton.Newton(fileName)
+        t1 = time.perf_counter()
+        (result, iterations) = newton.solve()
+        t2 = time.perf_counter()
+    times = {'parse': t1 - t0, 'newton': t2 - t1, 'iterations': iterations,
+             'factorizations': newton.stats['factorizations'],
+             'path': newton.stats['path'],
+             'converged': result is not None,
+             'nodes': len(result.nodeDict) if result else None}
+    # the seconds of the Newton phases: evaluate, stamp and solve
+    times.update((key, newton.stats[key]) for key in iccad_newton.TIMES)
+    return times
+
+
+def runCase(tool, fileName):
+    """Run one benchmark case; meant to be run in a fresh process
+    """
+    tracemalloc.start()
+    times = benchMNA(fileName) if tool == 'mna' else benchNewton(fileName)
+    times['tracedMB'] = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+    tracemalloc.stop()
+    times['maxRssMB'] = peakMemory()
+    return times
+
+
+def fitExponents(records, phases):
+    """Scaling exponent b of time ~ a * nodes^b of each generator and
+       phase, by a least squares line through the log-log points
+    """
+    fits = {}
+    for gen in sorted({r['generator'] for r in records}):
+        points = [r for r in records if r['generator'] == gen]
+        if len(points) < 2:
+            continue
+        x = np.log([r['nodes'] for r in points])
+        for phase in phases:
+            y = [r.get(phase) for r in points]
+            if None in y or min(y) <= 0:
+                continue
+            fits[(gen, phase)] = np.polyfit(x, np.log(y), 1)[0]
+    return fits
+
+
+def main():
+    """Command line entry: run the benchmarks and write the results
+    """
+    parser = argparse.ArgumentParser(
+        description='%(prog)s: benchmarks of iccad_mna and iccad_newton')
+    parser.add_argument(
+        '-g', '--generators', nargs='+', choices=list(GENERATORS),
+        default=['ladder', 'mesh2d', 'mesh3d', 'cube', 'diodes'],
+        help='netlist generators to run (default: all)')
+    parser.add_argument(
+        '-s', '--sizes', nargs='+', type=float,
+        default=[1e2, 1e3, 1e4, 1e5],
+        help='approximate node counts (default: 1e2 1e3 1e4 1e5)')
+    parser.add_argument(
+        '--max-diode-nodes', type=float, default=1e4,
+        help='largest diode network for the (slow) Newton demo')
+    parser.add_argument(
+        '-o', '--output', default='bench_results.json',
+        help='result file, JSON or (by a .csv name) CSV '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--keep', metavar='DIR',
+        help='write the generated netlists into DIR and keep them')
+    args = parser.parse_args()
+
+    workDir = args.keep or tempfile.mkdtemp(prefix='iccad_bench_')
+    os.makedirs(workDir, exist_ok=True)
+    records = []
+    for gen in args.generators:
+        tool = 'newton' if gen == 'diodes' else 'mna'
+        for size in args.sizes:
+            if tool == 'newton' and size > args.max_diode_nodes:
+                continue
+            fileName = os.path.join(workDir, "%s_%d.spice" % (gen, size))
+            writeNetlist(fileName, GENERATORS[gen](int(size)))
+            # a fresh process per case keeps the peak memory its own
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                times = pool.submit(runCase, tool, fileName).result()
+            if not args.keep:
+                os.remove(fileName)
+            record = {'generator': gen, 'tool': tool,
+                      'requestedNodes': int(size)}
+            record.update(times)
+            records.append(record)
+            print(json.dumps(record), file=sys.stderr)
+
+    if args.output.endswith('.csv'):
+        fields = sorted({k for r in records for k in r})
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=1)
+    print("Results written into %s" % args.output)
+
+    fits = fitExponents(records, ['parse', 'stamp', 'factor', 'solve',
+                                  'newton'])
+    print("Scaling exponents b of time ~ nodes^b:")
+    for ((gen, phase), b) in sorted(fits.items()):
+        print("  %-8s %-8s %.2f" % (gen, phase, b))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+"""For demonstrating a parallel domain decomposition (DDM) DC solver of
+large linear circuits, e.g. the resistor meshes of evalmesh.py, built on
+the MNA matrix of iccad_mna.py.
+The unknowns are split into k subdomains plus an interface: no interior
+unknown of one subdomain touches an interior unknown of another, so with
+the interface (G) numbered last, the matrix has an arrowhead shape
+    [A11             A1G] [X1]   [Z1]
+    [     A22        A2G] [X2]   [Z2]
+    [          ...   ...] [..] = [..]
+    [AG1  AG2  ...   AGG] [XG]   [ZG]
+Every interior block Add is factorized on its own by a worker process,
+which also returns its part of the Schur complement of the interface
+    S = AGG - sum of AGd * inv(Add) * AdG
+    g = ZG  - sum of AGd * inv(Add) * Zd
+Then S * XG = g is solved here, and the workers back-substitute
+    Xd = inv(Add) * (Zd - AdG * XG)
+in parallel. The matrix, the right hand side and the solution are held
+in shared memory, so workers read and write them without any copy.
+"""
+
+import sys
+import time
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+import iccad_mna as mna
+
+# Interface columns are eliminated this many at a time, which bounds the
+# memory of inv(Add) * AdG to (interior size) x (this) numbers
+SCHUR_BLOCK = 256
+
+
+def partition(A, k):
+    """Split the unknowns of matrix A into k subdomains and an interface.
+       The unknowns are laid out in reverse Cuthill-McKee order, which
+       keeps neighbors close, and cut into k chunks of equal size; every
+       unknown coupled to a later chunk goes to the interface. So do the
+       branch currents of v-sources (zero diagonal), since an interior
+       block holding one apart from its nodes would be singular.
+       Returns part, where part[i] is the subdomain of unknown i or -1.
+    """
+    n = A.shape[0]
+    pattern = abs(A).tocsr()
+    pattern = (pattern + pattern.T).tocsr()
+    order = reverse_cuthill_mckee(pattern, symmetric_mode=True)
+    part = np.empty(n, dtype=np.int64)
+    part[order] = np.arange(n) * k // n
+
+    coo = pattern.tocoo()
+    later = part[coo.row] < part[coo.col]
+    part[coo.row[later]] = -1
+    part[A.diagonal() == 0] = -1
+    return part
+
+
+class SharedArray:
+    """A NumPy array in a block of shared memory, which is attached by
+       name in other processes, e.g. SharedArray.attach(*sa.spec())
+    """
+
+    def __init__(self, shm, shape, dtype, owner):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.owner = owner
+
+    @classmethod
+    def copyOf(cls, array):
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(array.nbytes, 1))
+        sa = cls(shm, array.shape, array.dtype, True)
+        sa.array[...] = array
+        return sa
+
+    @classmethod
+    def attach(cls, name, shape, dtype):
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype,
+                   False)
+
+    def spec(self):
+        return (self.shm.name, self.array.shape, self.array.dtype.str)
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class Subdomain:
+    """One subdomain d of a partitioned matrix: its interior block Add
+       factorized, and its coupling AdG/AGd with the interface unknowns
+       gIdx it touches (positions in the interface)
+    """
+
+    def __init__(self, A, part, d):
+        self.interior = np.flatnonzero(part == d)
+        interface = np.flatnonzero(part < 0)
+        rows = A[self.interior]
+        AdG = rows[:, interface].tocsc()
+        AGd = A[interface][:, self.interior].tocsr()
+        # only the interface unknowns coupled with this subdomain matter
+        self.gIdx = np.union1d(np.flatnonzero(np.diff(AdG.indptr)),
+                               np.flatnonzero(np.diff(AGd.indptr)))
+        self.AdG = AdG[:, self.gIdx].tocsr()
+        self.AGd = AGd[self.gIdx].tocsr()
+        self.lu = spla.splu(rows[:, self.interior].tocsc())
+
+    def schur(self, Z):
+        """This subdomain's AGd * inv(Add) * AdG and AGd * inv(Add) * Zd
+        """
+        g = len(self.gIdx)
+        S = np.zeros((g, g), dtype=self.AdG.dtype)
+        for start in range(0, g, SCHUR_BLOCK):
+            block = self.AdG[:, start:start + SCHUR_BLOCK].toarray()
+            S[:, start:start + SCHUR_BLOCK] = \
+                self.AGd @ self.lu.solve(block)
+        return S, self.AGd @ self.lu.solve(Z[self.interior])
+
+    def backSubstitute(self, Z, X, interface):
+        """Xd = inv(Add) * (Zd - AdG * XG), written into X
+        """
+        XG = X[interface[self.gIdx]]
+        X[self.interior] = self.lu.solve(Z[self.interior] - self.AdG @ XG)
+
+
+def subdomainWorker(conn, specs, domains):
+    """Process entry: factorize the subdomains in 'domains' of the shared
+       matrix, send their Schur complement parts, then wait for the
+       interface solution and back-substitute
+    """
+    shared = [SharedArray.attach(*spec) for spec in specs]
+    (data, indices, indptr, part, Z, X) = [sa.array for sa in shared]
+    n = len(part)
+    A = sp.csr_matrix((data, indices, indptr), shape=(n, n))
+    interface = np.flatnonzero(part < 0)
+
+    try:
+        t0 = time.perf_counter()
+        # a small subdomain may have gone to the interface as a whole
+        subs = [Subdomain(A, part, d) for d in domains if np.any(part == d)]
+        parts = [(sub.gIdx,) + sub.schur(Z) for sub in subs]
+        conn.send((parts, time.perf_counter() - t0))
+
+        conn.recv()  # the interface solution is in X now
+        t0 = time.perf_counter()
+        for sub in subs:
+            sub.backSubstitute(Z, X, interface)
+        conn.send(time.perf_counter() - t0)
+    except Exception as err:
+        # hand the error over, instead of leaving the parent waiting
+        conn.send(err)
+    finally:
+        conn.close()
+        del A, data, indices, indptr, part, Z, X
+        for sa in shared:
+            sa.close()
+
+
+def receive(conn):
+    """Receive a message from a worker, raising any error it has sent
+    """
+    message = conn.recv()
+    if isinstance(message, Exception):
+        raise message
+    return message
+
+
+def solveArrowhead(A, Z, part, k, processes):
+    """Solve A * X = Z partitioned by part into k subdomains, which are
+       shared by 'processes' worker processes. Returns X and the seconds
+       taken by each phase.
+    """
+    n = A.shape[0]
+    A = A.tocsr()
+    timing = {}
+    shared = [SharedArray.copyOf(a) for a in
+              (A.data, A.indices, A.indptr, part, Z, np.zeros(n, Z.dtype))]
+    X = shared[-1].array
+    interface = np.flatnonzero(part < 0)
+    workers = []
+    try:
+        t0 = time.perf_counter()
+        for p in range(processes):
+            (conn, childConn) = mp.Pipe()
+            proc = mp.Process(target=subdomainWorker,
+                              args=(childConn, [sa.spec() for sa in shared],
+                                    list(range(p, k, processes))))
+            proc.start()
+            childConn.close()  # a dead worker then ends conn.recv()
+            workers.append((proc, conn))
+
+        # S = AGG - sum of subdomain parts, assembled as triplets
+        AGG = A[interface][:, interface].tocoo()
+        (rows, cols, vals) = ([AGG.row], [AGG.col], [AGG.data])
+        g = Z[interface].copy()
+        for (proc, conn) in workers:
+            (parts, seconds) = receive(conn)
+            for (gIdx, Sd, gd) in parts:
+                rows.append(np.repeat(gIdx, len(gIdx)))
+                cols.append(np.tile(gIdx, len(gIdx)))
+                vals.append(-Sd.ravel())
+                g[gIdx] -= gd
+        timing['factor'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        if len(interface) > 0:
+            S = sp.coo_matrix((np.concatenate(vals), (np.concatenate(rows),
+                                                      np.concatenate(cols))),
+                              shape=(len(interface), len(interface)))
+            X[interface] = spla.splu(S.tocsc()).solve(g)
+        timing['interface'] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for (proc, conn) in workers:
+            conn.send(True)
+        for (proc, conn) in workers:
+            receive(conn)
+            proc.join()
+        timing['backsolve'] = time.perf_counter() - t0
+        timing['interfaceSize'] = len(interface)
+        return X.copy(), timing
+    finally:
+        X = None
+        for (proc, conn) in workers:
+            if proc.is_alive():
+                proc.terminate()
+        for sa in shared:
+            sa.close()
+
+
+def solve_ddm(ckt, domains=4, processes=None):
+    """DC analysis of Circuit ckt by domain decomposition into 'domains'
+       subdomains, factorized by 'processes' worker processes (default:
+       one per subdomain, at most the number of CPU cores). Returns a
+       DCResult, which also has the seconds per phase as .timing.
+    """
+    if processes is None:
+        processes = min(domains, mp.cpu_count())
+    t0 = time.perf_counter()
+    (stampRow, stampCol, stampVal, vectorZ) = mna.stampTriplets(ckt)
+    size = ckt.N + ckt.M
+    A = sp.coo_matrix((stampVal, (stampRow, stampCol)),
+                      shape=(size, size)).tocsr()
+    part = partition(A, domains)
+    partitionTime = time.perf_counter() - t0
+
+    (X, timing) = solveArrowhead(A, vectorZ, part, domains, processes)
+    timing['partition'] = partitionTime
+    res = mna.DCResult(X[:ckt.N], X[ckt.N:], ckt.nodeDict, ckt.vsrcDict)
+    res.timing = timing
+    return res
+
+
+def speedupReport(ckt, domains, processCounts):
+    """Time the serial sparse LU of iccad_mna and solve_ddm() with each
+       number of processes in processCounts, checking every answer
+       against the serial one; returns a list of report lines
+    """
+    t0 = time.perf_counter()
+    serial = mna.solve_dc(ckt)
+    serialTime = time.perf_counter() - t0
+    lines = ["serial LU: %.3fs" % serialTime,
+             "processes\tseconds\tspeedup\tmax |dV|\tinterface"]
+    for processes in processCounts:
+        t0 = time.perf_counter()
+        res = solve_ddm(ckt, domains, processes)
+        seconds = time.perf_counter() - t0
+        error = np.max(np.abs(res.nodeVolt - serial.nodeVolt))
+        lines.append("%d\t%.3f\t%.2f\t%.2e\t%d"
+                     % (processes, seconds, serialTime / seconds, error,
+                        res.timing['interfaceSize']))
+    return lines
+
+
+def main():
+    """Command line entry: DC analysis of a netlist by DDM
+    """
+    parser = argparse.ArgumentParser(
+        description='%(prog)s: DC analysis by parallel domain decomposition')
+    parser.add_argument(
+        'netlist', help='input circuit file name')
+    parser.add_argument(
+        '-k', '--domains', type=int, default=4,
+        help='number of subdomains (default: %(default)s)')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: one per subdomain, '
+             'at most the CPU cores)')
+    parser.add_argument(
+        '--report', action='store_true',
+        help='report the speedup over the serial LU for 1, 2, 4, ... '
+             'processes up to --jobs, instead of printing the result')
+    args = parser.parse_args()
+
+    ckt = mna.Circuit.fromFile(args.netlist)
+    if args.report:
+        maxJobs = args.jobs or min(args.domains, mp.cpu_count())
+        counts = sorted({min(2 ** i, maxJobs)
+                         for i in range(maxJobs.bit_length() + 1)})
+        print("%s: %d unknowns, %d subdomains, %d CPU cores"
+              % (args.netlist, ckt.N + ckt.M, args.domains,
+                 mp.cpu_count()))
+        print(*speedupReport(ckt, args.domains, counts), sep="\n")
+        return
+
+    res = solve_ddm(ckt, args.domains, args.jobs)
+    for node in res.nodeDict.keys():
+        print("node %s: %sV"
+              % (node, mna.formatValue(res.nodeVolt[res.nodeDict[node]])))
+    if ckt.usingMNA:
+        print("------")
+        for vsrc in res.vsrcDict.keys():
+            print("vsource %s: %sA"
+                  % (vsrc, mna.formatValue(res.vsrcCurr[res.vsrcDict[vsrc]])))
+    print("------", file=sys.stderr)
+    print("interface %d unknowns; partition %.3fs, factor %.3fs, "
+          "interface %.3fs, backsolve %.3fs"
+          % (res.timing['interfaceSize'], res.timing['partition'],
+             res.timing['factor'], res.timing['interface'],
+             res.timing['backsolve']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
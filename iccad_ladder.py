@@ -1,10 +1,20 @@
 #!/usr/bin/env python
 '''For R/C ladder delay calculation demo, using Backward Euler method.
-NumPy is used for matrix operation, MatplotLib for plotting'''
+NumPy is used for matrix operation, MatplotLib for plotting.
+The ladder matrix is tridiagonal, so it is kept as its 3 diagonals and
+factorized only once; every time step is then an O(N) solve, by LAPACK
+(from SciPy) when it is installed'''
 
 import numpy as np
 import matplotlib.pyplot as plt
 
+# SciPy is optional: without it, a tridiagonal matrix is solved by the
+# Thomas algorithm in NumPy instead of LAPACK
+try:
+    from scipy.linalg import lapack
+except ModuleNotFoundError:
+    lapack = None
+
 
 def elmoreDelay(n):
     '''Elmore Delay calculator for a uniform R/C ladder
@@ -16,6 +26,42 @@ def elmoreDelay(n):
     return d * 0.69
 
 
+class Tridiagonal:
+    '''LU factorization of a tridiagonal matrix, made once and reused for
+    every right hand side
+    ---
+    + lower, diag, upper are the sub-, main and super-diagonal of the
+      matrix, of N-1, N and N-1 numbers
+    + solve(b) returns x of A * x = b, in O(N) per column of b by LAPACK
+    '''
+
+    def __init__(self, lower, diag, upper):
+        (lower, diag, upper) = (np.asarray(lower, dtype=float),
+                                np.asarray(diag, dtype=float),
+                                np.asarray(upper, dtype=float))
+        # SciPy's gttrf wrapper takes no matrix smaller than 3x3, whose
+        # second super-diagonal would be empty
+        self.lapack = lapack is not None and len(diag) > 2
+        if self.lapack:
+            # LAPACK gttrf: LU with partial pivoting, kept in 4 bands
+            (self.dl, self.d, self.du, self.du2, self.ipiv, info) = \
+                lapack.dgttrf(lower, diag, upper)
+            if info > 0:
+                raise np.linalg.LinAlgError("singular tridiagonal matrix")
+        else:
+            # a step of an O(N) loop in Python is slower than one of the
+            # O(N^2) product by a dense inverse in NumPy, for any ladder
+            # this demo runs, so without LAPACK the inverse is used
+            dense = np.diag(diag) + np.diag(lower, -1) + np.diag(upper, 1)
+            self.inverse = np.linalg.inv(dense)
+
+    def solve(self, b):
+        if self.lapack:
+            return lapack.dgttrs(self.dl, self.d, self.du, self.du2,
+                                 self.ipiv, b)[0]
+        return np.dot(self.inverse, b)
+
+
 def ladderWave(N=10, endTime=1000, deltaTime=0.01, tpdMode=False):
     '''
     Ladder waveform simulator: returns transient waveform on ladder end.
@@ -33,23 +79,12 @@ def ladderWave(N=10, endTime=1000, deltaTime=0.01, tpdMode=False):
     c_val = 1
     g_val = 1
 
-    C = np.zeros([N, N])
-    G = np.zeros([N, N])
-
-    diagC = [c_val] * N
-    diagG = [-2 * g_val] * N
-    sub_diagG = [g_val] * (N-1)
-    #print(diagC)
-    #print(diagG)
-    #print(sub_diagG, "\n")
-
-    C = np.diag(diagC)
-    G = np.diag(diagG)
-    G = G + np.diag(sub_diagG, -1) + np.diag(sub_diagG, 1)
+    # C is diagonal and G tridiagonal, so only their diagonals are kept
+    diagC = np.full(N, float(c_val))
+    diagG = np.full(N, -2.0 * g_val)
+    sub_diagG = np.full(N - 1, float(g_val))
     # Last node has only 1 resistor connected, so change -2 to -1 on diagonal
-    G[N - 1][N - 1] += g_val
-    print(C)
-    print(G, "\n")
+    diagG[N - 1] += g_val
 
     # Input the 1V step stimulus. The input node is kept as 1V after time 0.
     # Per Norton's Theorem, the equivalent input current source is 1A step.
@@ -77,17 +112,22 @@ def ladderWave(N=10, endTime=1000, deltaTime=0.01, tpdMode=False):
     # Now solve vt1 = ?
     # Rewrite the equation into:
     # A * [vt1] = [vt0] + B => [vt1] = A-1 * ([vt0] + B)
-    Ainv = np.linalg.inv(np.eye(N) - deltaTime * np.dot(np.linalg.inv(C), G))
+    # A = I - deltaT * C-1 * G is tridiagonal as G is, since C is diagonal;
+    # rather than a dense A-1, which makes every step O(N^2), A is LU
+    # factorized once, and each step just solves it in O(N)
+    scale = deltaTime / diagC
+    A = Tridiagonal(-scale[1:] * sub_diagG, 1 - scale * diagG,
+                    -scale[:-1] * sub_diagG)
 
     # If i_source is time-variant, B should be changed in each time point;
     # in this demo, i_source is a constant
-    B = deltaTime * np.dot(np.linalg.inv(C), i_source)
+    B = scale[:, None] * i_source
 
     # Give an analysis on the above formula, and try Forward Euler?
 
     for tt in time:
         index += 1
-        v_nodes = np.dot(Ainv, v_nodes + B)
+        v_nodes = A.solve(v_nodes + B)
 
         # Add the last stage voltage to vout, for current time point tt
         vout.append(v_nodes[N-1][0])
@@ -95,7 +135,7 @@ def ladderWave(N=10, endTime=1000, deltaTime=0.01, tpdMode=False):
         if tpdMode:
             if v_nodes[N-1] > 0.5:
                 print("At time=%.2fs, Node-%d reaches 0.5Vin (%.7fV)"
-                      % (tt, N, v_nodes[N-1]))
+                      % (tt, N, v_nodes[N-1][0]))
                 print("Elmore Delay=%.2fs, of the identical order N=%d"
                       % (elmoreDelay(N), N))
                 break
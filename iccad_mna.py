@@ -1,181 +1,1501 @@
 #!/usr/bin/env python
 """For demonstrating DC analysis of linear circuit using both
 Nodal Analysis(NA) and Modified Nodal Analysis(MNA) methods.
-NumPy is used for matrix operation.
+NumPy is used for matrix operation. When SciPy is available, the
+matrix is kept in sparse form and solved by a sparse LU factorization,
+so that large resistor meshes and power grids fit into memory.
+The program can also be imported by other programs, which then build
+a Circuit and call solve_dc() on it without any text file in between:
+
+    import iccad_mna as mna
+    ckt = mna.Circuit.fromFile("cube.spice")
+    res = mna.solve_dc(ckt)
+    print(res.nodeVolt[res.nodeDict["D2"]])
 """
 
 # edited for github re-post in 03/27/2024
 
 import sys
+import os
+import time
+import hashlib
+import argparse
+from collections import OrderedDict
 import numpy as np
 
+from spice_parse import isnotGround, parseNetlist, parseFile, spiceValue, \
+    KIND_R, KIND_I, KIND_V, KIND_C, KIND_L, KIND_Z
+
+# SciPy sparse matrices are optional; without them the dense NumPy
+# path below is still used, which is fine for tiny textbook circuits
+try:
+    import scipy.sparse as sp
+    import scipy.sparse.linalg as spla
+    from scipy.sparse.csgraph import reverse_cuthill_mckee, \
+        connected_components
+except ModuleNotFoundError:
+    sp = None
+
+# Systems with no more unknowns than this are solved densely; the
+# overhead of sparse factorization does not pay off for them
+DENSE_SIZE_LIMIT = 64
+
+# Tiny conductance (in Siemens) from a node to ground, as SPICE's GMIN
+GMIN = 1e-12
 
-def isnotGround(node_name):
-    """Is the node_name not an alias of Ground?
+# Fill-reducing column orderings applied before sparse LU, by name:
+# SuperLU's own orderings, or reverse Cuthill-McKee, which gives a narrow
+# band, e.g. on ladders; 'amd' is minimum degree on the pattern of A + AT,
+# usually the least fill on meshes, and 'colamd' is SuperLU's default
+ORDERINGS = {'natural': 'NATURAL', 'rcm': None,
+             'amd': 'MMD_AT_PLUS_A', 'colamd': 'COLAMD'}
+
+
+class SymbolicLU:
+    """The part of a sparse LU factorization that depends only on where
+       the nonzero entries are, not on their values: the column order
+       chosen to reduce fill-in, and the layout of the column-permuted
+       matrix in CSC form. Circuits of the same topology share it, so that
+       factorizing one of them again is a numeric refactorization only.
+       ---
+       + perm is the column order: column j of the permuted matrix A * P
+         is column perm[j] of A; the solution of A * X = Z is then
+         X[perm] = Y, where Y solves (A * P) * Y = Z
+       + indices/indptr are the CSC row indices and column pointers of
+         A * P, and where maps each stamp triplet onto its CSC entry, so
+         that repeated (row, column) pairs are summed by one scatter
+       + nnz is the number of stamp triplets it was built for
     """
-    return bool(node_name not in ('0', 'GND'))
+
+    def __init__(self, size, perm, indices, indptr, where):
+        self.size = size
+        self.perm = perm
+        self.indices = indices
+        self.indptr = indptr
+        self.where = where
+        self.nnz = len(where)
+
+    @classmethod
+    def analyze(cls, size, stampRow, stampCol, perm):
+        """Lay out the triplet pattern as the CSC matrix of columns
+           permuted by perm
+        """
+        newCol = np.empty(size, dtype=np.int64)
+        newCol[perm] = np.arange(size)
+        keys = newCol[stampCol] * size + stampRow
+        (uniqueKeys, where) = np.unique(keys, return_inverse=True)
+        indptr = np.searchsorted(uniqueKeys // size, np.arange(size + 1))
+        return cls(size, np.asarray(perm, dtype=np.int64),
+                   uniqueKeys % size, indptr, where.ravel())
+
+    @classmethod
+    def rcm(cls, size, stampRow, stampCol):
+        """Analyze the pattern in reverse Cuthill-McKee order, which is
+           taken on the symmetric pattern of A + AT
+        """
+        ones = np.ones(len(stampRow), dtype=np.int8)
+        pattern = sp.coo_matrix((ones, (stampRow, stampCol)),
+                                shape=(size, size)).tocsr()
+        perm = reverse_cuthill_mckee((pattern + pattern.T).tocsr(),
+                                     symmetric_mode=True)
+        return cls.analyze(size, stampRow, stampCol, perm)
+
+    def matrix(self, stampVal):
+        """The CSC matrix A * P of stamp values on this pattern
+        """
+        data = scatterSum(self.where, stampVal, len(self.indices))
+        return sp.csc_matrix((data, self.indices, self.indptr),
+                             shape=(self.size, self.size))
 
 
-class Component():
-    """Component is a class, which has 4 class members for
-       each circuit component: name, pNode, nNode and value
+class LUFactor:
+    """LU factorization of a size x size matrix A, which is given by its
+       (row, column, value) triplets. A sparse LU factorization is used,
+       unless SciPy is missing or the system is tiny, in which case the
+       dense matrix is built and inverted as in the textbook.
+       Once factorized, solve() can be called for any number of right hand
+       sides, given one by one or as columns of a 2-D block.
+       The matrix itself is kept as self.A (dense or CSC) for checking
+       residuals by matrix-vector products, which dot() does.
+       The sparse path orders the columns by 'ordering', a key of
+       ORDERINGS. Given a SymbolicLU of the same pattern, it skips both
+       the ordering and the COO to CSC conversion; with analyze=True, the
+       SymbolicLU of a fresh factorization is kept as self.analysis.
+       stats() reports the size, fill and bandwidth of the factorization.
+    """
+
+    def __init__(self, size, stampRow, stampCol, stampVal, symbolic=None,
+                 analyze=False, ordering='colamd'):
+        self.size = size
+        self.symbolic = None
+        if ORDERINGS[ordering] is None and symbolic is None \
+                and sp is not None and size > DENSE_SIZE_LIMIT:
+            symbolic = SymbolicLU.rcm(size, stampRow, stampCol)
+        self.analysis = symbolic
+        self.stampRow = stampRow
+        self.stampCol = stampCol
+        if sp is None or size <= DENSE_SIZE_LIMIT:
+            A = np.zeros([size, size], dtype=np.result_type(stampVal))
+            # np.add.at() sums repeated (row, column) pairs, as COO does
+            np.add.at(A, (stampRow, stampCol), stampVal)
+            self.Ainv = np.linalg.inv(A)
+            self.lu = None
+        elif symbolic is not None:
+            # columns are already in order, so SuperLU keeps them as is
+            self.symbolic = symbolic
+            A = symbolic.matrix(stampVal)
+            self.lu = spla.splu(A, permc_spec='NATURAL')
+        else:
+            # COO (coordinate) format is the natural one for stamping, while
+            # CSC (compressed sparse column) format is what LU needs
+            A = sp.coo_matrix((stampVal, (stampRow, stampCol)),
+                              shape=(size, size)).tocsc()
+            self.lu = spla.splu(A, permc_spec=ORDERINGS[ordering])
+            if analyze:
+                # the column order SuperLU has chosen: A * P is factorized
+                # with column j of it taken from column argsort(perm_c)[j]
+                self.analysis = SymbolicLU.analyze(
+                    size, stampRow, stampCol, np.argsort(self.lu.perm_c))
+        self.A = A
+
+    def solve(self, rhs):
+        """Solve A * X = rhs, with rhs a vector or a block of columns
+        """
+        if self.lu is None:
+            return np.dot(self.Ainv, rhs)
+        if self.symbolic is None:
+            return self.lu.solve(rhs)
+        Y = self.lu.solve(rhs)
+        X = np.empty_like(Y)
+        X[self.symbolic.perm] = Y
+        return X
+
+    def dot(self, x):
+        """Product A * x of the factorized matrix, e.g. for residuals
+        """
+        if self.symbolic is None:
+            return self.A.dot(x)
+        # self.A holds the column-permuted matrix A * P
+        return self.A.dot(x[self.symbolic.perm])
+
+    def columnPosition(self):
+        """Position of each column of A in the factorized order
+        """
+        if self.lu is None:
+            return np.arange(self.size)
+        if self.symbolic is None:
+            return self.lu.perm_c
+        return np.argsort(self.symbolic.perm)
+
+    def stats(self):
+        """Statistics of the matrix and its factorization, as a dict
+           ---
+           + size, and nnz of the matrix A
+           + bandwidth: the largest |i - j| of a nonzero A(i, j), with
+             rows and columns in the factorized column order
+           + predictedFill: nonzeros inside the envelope (profile) of the
+             symmetric pattern of A + AT in that order, on both sides, the
+             bound of fill-in without pivoting
+           + actualFill: nonzeros of L and U, with the diagonal once;
+             the dense path counts the full size x size inverse
+        """
+        pos = self.columnPosition()
+        rows = pos[self.stampRow]
+        cols = pos[self.stampCol]
+        nnz = len(np.unique(rows * self.size + cols))
+        bandwidth = int(np.max(np.abs(rows - cols))) if len(rows) else 0
+        # envelope: for each row i, all columns from its leftmost nonzero
+        # (on the symmetric pattern) up to the diagonal
+        first = np.arange(self.size)
+        np.minimum.at(first, rows, cols)
+        np.minimum.at(first, cols, rows)
+        envelope = int(np.sum(np.arange(self.size) - first))
+        if self.lu is None:
+            actualFill = self.size * self.size
+        else:
+            actualFill = self.lu.L.nnz + self.lu.U.nnz - self.size
+        return {'size': self.size, 'nnz': nnz, 'bandwidth': bandwidth,
+                'predictedFill': 2 * envelope + self.size,
+                'actualFill': actualFill}
+
+
+class FactorCache:
+    """Cache of SymbolicLU objects keyed by circuit topology, so that
+       repeated runs on the same netlist structure with other element
+       values, e.g. Newton iterations, alterparam batches or regenerated
+       meshes, only refactorize numerically. Each entry keeps the node
+       map it was built for as well, which is compared on every hit.
+       Entries are kept in memory, or also as .npz files in a directory
+       shared by later runs; both are evicted least recently used first.
        ---
-       + matrixFill() configures the nodal matrix for each component
+       + maxEntries limits the entries in memory, and in the directory
+       + hits/misses count lookups
     """
 
-    def __init__(self, name, positiveNode, negativeNode, value):
-        self.name = name
-        self.pNode = positiveNode
-        self.nNode = negativeNode
-        self.value = value
+    def __init__(self, directory=None, maxEntries=16):
+        self.directory = directory
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
 
-    def matrixFill(self, matG, matB, vecI, vecE):
-        """Fill matrices matG and vecI, according to self's value.
-           If self is a voltage source, matB and vecE are filled.
+    @staticmethod
+    def topologyKey(ckt):
+        """Hash of everything the matrix pattern depends on: component
+           kinds and nodes, and the node names in their numbering order
         """
-        # what if value is a complex number?
-        value = float(self.value)
+        h = hashlib.sha1()
+        h.update(np.array([ckt.N, ckt.M], dtype=np.int64).tobytes())
+        for table in (ckt.kind, ckt.pIdx, ckt.nIdx):
+            h.update(np.ascontiguousarray(table).tobytes())
+        h.update("\0".join(ckt.nodeDict.keys()).encode())
+        for (model, nodes) in ckt.macromodels:
+            h.update(np.ascontiguousarray(nodes).tobytes())
+        return h.hexdigest()
 
-        # Why use 'try' here? Because '0' and GND' are not in nodeDict,
-        # and that will cause an error. Using try can avoid this error.
-        # Not good practice, but useful in showing try/except pair.
-        try:
-            nP = nodeDict[self.pNode]
-        except KeyError:
-            pass
+    def fileName(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def lookup(self, ckt, nnz, ordering='colamd'):
+        """SymbolicLU of ckt's topology with nnz stamp triplets, or None
+        """
+        key = self.topologyKey(ckt) + "-" + ordering
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        elif self.directory and os.path.exists(self.fileName(key)):
+            with np.load(self.fileName(key)) as f:
+                entry = (SymbolicLU(int(f['size']), f['perm'], f['indices'],
+                                    f['indptr'], f['where']),
+                         list(f['nodeNames']))
+            os.utime(self.fileName(key))  # mark as recently used
+            self.remember(key, entry)
+        if (entry is None or entry[0].nnz != nnz
+                or entry[1] != list(ckt.nodeDict.keys())):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def store(self, ckt, symbolic, ordering='colamd'):
+        """Keep the SymbolicLU of ckt's topology
+        """
+        key = self.topologyKey(ckt) + "-" + ordering
+        nodeNames = list(ckt.nodeDict.keys())
+        self.remember(key, (symbolic, nodeNames))
+        if self.directory:
+            # write then rename, so that no run reads a partial file
+            tmpName = self.fileName(key) + ".%d.tmp" % os.getpid()
+            with open(tmpName, 'wb') as f:
+                np.savez(f, size=symbolic.size, perm=symbolic.perm,
+                         indices=symbolic.indices, indptr=symbolic.indptr,
+                         where=symbolic.where,
+                         nodeNames=np.array(nodeNames, dtype=str))
+            os.replace(tmpName, self.fileName(key))
+            files = sorted((os.path.join(self.directory, name)
+                            for name in os.listdir(self.directory)
+                            if name.endswith(".npz")), key=os.path.getmtime)
+            for name in files[:-self.maxEntries]:
+                os.remove(name)
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+
+def factorCircuit(ckt, stampRow, stampCol, stampVal, cache=None,
+                  ordering='colamd'):
+    """LUFactor of the stamped matrix of Circuit ckt, reusing the
+       symbolic analysis of the same topology from a FactorCache if given
+    """
+    if cache is None:
+        return LUFactor(ckt.N + ckt.M, stampRow, stampCol, stampVal,
+                        ordering=ordering)
+    symbolic = cache.lookup(ckt, len(stampRow), ordering)
+    factor = LUFactor(ckt.N + ckt.M, stampRow, stampCol, stampVal,
+                      symbolic=symbolic, analyze=symbolic is None,
+                      ordering=ordering)
+    if symbolic is None and factor.analysis is not None:
+        cache.store(ckt, factor.analysis, ordering)
+    return factor
+
+
+def solveMatrix(size, stampRow, stampCol, stampVal, vecZ):
+    """Solve A * X = vecZ once, where A is given by its triplets
+    """
+    return LUFactor(size, stampRow, stampCol, stampVal).solve(vecZ)
+
+
+class Circuit:
+    """A Circuit holds its components as struct-of-arrays tables, i.e. one
+       NumPy array per component field instead of one object per component,
+       so that it is stamped by a few vectorized operations and can be
+       solved over and over again in-process.
+       ---
+       + names/kind/pIdx/nIdx/value are the component tables, where
+         pIdx/nIdx hold node numbers and -1 stands for ground; value is
+         a complex array when any Z element has a complex impedance
+       + nodeDict/vsrcDict map node/v-source names to matrix indices;
+         an inductor is a 0V v-source at DC, so it is in vsrcDict too
+       + N/M are the numbers of (non-ground) nodes and v-sources
+       + usingMNA tells whether any v-source forces MNA to be used
+       + acValues maps source names to their complex AC excitations,
+         and waveforms to their transient (keyword, [values]) waveforms
+       + macromodels lists (Macromodel, K x P array of node numbers) of
+         the blocks stamped as N-port macromodels, see addMacromodel()
+       + gminNodes lists the nodes tied to ground by GMIN at DC, besides
+         the capacitor-only nodes, see checkTopology()
+       + setValue() changes a component value before the next solve
+    """
+
+    def __init__(self, names, kind, pIdx, nIdx, value, nodeDict):
+        self.names = list(names)
+        self.kind = np.asarray(kind, dtype=np.int8)
+        self.pIdx = np.asarray(pIdx, dtype=np.int64)
+        self.nIdx = np.asarray(nIdx, dtype=np.int64)
+        self.value = np.array(value)
+        if not np.iscomplexobj(self.value):
+            self.value = self.value.astype(float)
+        self.nodeDict = dict(nodeDict)
+        self.compDict = {name: i for (i, name) in enumerate(self.names)}
+
+        # Each v-source (or inductor) is numbered from 0 in order of
+        # appearance, and its row/column follows all N node rows/columns
+        # in the MNA matrix
+        isV = (self.kind == KIND_V) | (self.kind == KIND_L)
+        self.vIdx = np.cumsum(isV) - 1
+        self.vsrcDict = {self.names[i]: int(self.vIdx[i])
+                         for i in np.flatnonzero(isV)}
+
+        # Determine the dimensions N, M; i.e., how many nodes, v-sources?
+        self.N = len(self.nodeDict)
+        self.M = len(self.vsrcDict)
+
+        # If any V source met, MNA must be used
+        self.usingMNA = self.M > 0
+
+        # dot cards of the netlist, e.g. ['.DC', 'V1', '0', '5', '0.1']
+        self.controls = []
+        self.models = {}  # .model cards, see spice_parse.Netlist
+        self.acValues = {}
+        self.waveforms = {}
+        self.macromodels = []
+        # nodes tied to ground by GMIN on top of capacitor-only ones
+        self.gminNodes = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def fromNetlist(cls, netlist):
+        """Create a Circuit from a spice_parse.Netlist; any X instance
+           left unexpanded in it is stamped as the Macromodel of its subckt
+        """
+        ckt = cls(*netlist.tables(), netlist.nodeDict)
+        ckt.controls = netlist.controls
+        ckt.models = netlist.models
+        ckt.acValues = {ckt.names[i]: value
+                        for (i, value) in netlist.acValues.items()}
+        ckt.waveforms = {ckt.names[i]: waveform
+                         for (i, waveform) in netlist.waveforms.items()}
+        bySubckt = {}
+        for (instName, nodes, subName) in netlist.instances:
+            bySubckt.setdefault(subName, []).append(nodes)
+        for (subName, nodes) in bySubckt.items():
+            ckt.addMacromodel(Macromodel.fromSubckt(netlist.subckts[subName]),
+                              nodes)
+        return ckt
+
+    @classmethod
+    def fromFile(cls, fileName, macromodels=()):
+        """Read in and parse a netlist file into a Circuit; instances of
+           the subckts named in macromodels are reduced to their ports
+        """
+        return cls.fromNetlist(parseFile(fileName, macromodels))
+
+    @classmethod
+    def fromLines(cls, lines, macromodels=()):
+        """Parse netlist cards held in memory into a Circuit, as fromFile()
+        """
+        return cls.fromNetlist(parseNetlist(lines, macromodels))
+
+    def addMacromodel(self, model, nodes):
+        """Stamp Macromodel model on nodes, a list of P node names or
+           numbers in the order of its ports, or on each row of a K x P
+           array of node numbers for K instances at once. New node names
+           are appended to the nodes of the circuit.
+        """
+        if np.ndim(nodes) == 1:
+            nodes = [nodes]
+        nodes = np.array([[self.addNode(n) if isinstance(n, str) else n
+                           for n in row] for row in nodes], dtype=np.int64)
+        self.macromodels.append((model, nodes))
+
+    def addNode(self, name):
+        """Number of node 'name', appended to nodeDict if it is new
+        """
+        name = name.upper()
+        if not isnotGround(name):
+            return -1
+        if name not in self.nodeDict:
+            self.nodeDict[name] = self.N
+            self.N += 1
+        return self.nodeDict[name]
+
+    def setValue(self, name, value):
+        """Change the value of component 'name' (case-insensitive)
+        """
+        if np.iscomplexobj(value) and not np.iscomplexobj(self.value):
+            self.value = self.value.astype(complex)
+        self.value[self.compDict[name.upper()]] = value
+
+    def acValue(self):
+        """Component values in AC analysis: sources are set to their AC
+           excitations, or to zero without any. A netlist without any AC
+           field, such as test_circuits/tryz.spice, keeps its source
+           values as AC excitations instead.
+        """
+        value = self.value.astype(complex)
+        if self.acValues:
+            isSource = (self.kind == KIND_V) | (self.kind == KIND_I)
+            value[isSource] = 0
+            for (name, acValue) in self.acValues.items():
+                value[self.compDict[name]] = acValue
+        return value
+
+
+def scatterSum(index, weights, size):
+    """Sum weights into an array of size by index, i.e. the vectorized
+       form of 'for i, w: array[i] += w'. np.bincount() only takes real
+       weights, so a complex sum is split into real and imaginary parts.
+    """
+    if np.iscomplexobj(weights):
+        return (np.bincount(index, weights.real, minlength=size)
+                + 1j * np.bincount(index, weights.imag, minlength=size))
+    return np.bincount(index, weights, minlength=size)
+
+
+def stampTriplets(ckt, value=None):
+    """Stamp all components of Circuit ckt at once. Returns the
+       (row, column, value) triplet arrays of the nodal matrix
+          G    B
+       [        ]
+          BT   D
+       where BT is the transpose of B, and D is all zero here, together
+       with the right hand side vector [VI, VE].
+       Every kind of component is stamped by a handful of array operations
+       over the whole table; entries touching ground (index -1) are simply
+       masked out, instead of checking every component with isnotGround().
+       Repeated (row, column) pairs are summed when the triplets are
+       converted into a matrix, just like '+=' on a dense one.
+       This is the DC (or frequency-independent) part of the matrix:
+       capacitors are left open, and inductors are 0V v-sources.
+       Nodes connected only to capacitors get a GMIN conductance to
+       ground, so that the DC matrix is not singular, and so do the
+       nodes in ckt.gminNodes, e.g. set by checkTopology().
+       Another value array, e.g. ckt.acValue(), may replace ckt.value.
+    """
+    N = ckt.N
+    M = ckt.M
+    kind, pIdx, nIdx = ckt.kind, ckt.pIdx, ckt.nIdx
+    if value is None:
+        value = ckt.value
+
+    # Resistor handling: each one has 4 entries of +-1/R;
+    # a Z element is just a resistor of complex impedance
+    isR = (kind == KIND_R) | (kind == KIND_Z)
+    pR = pIdx[isR]
+    nR = nIdx[isR]
+    gR = 1.0 / value[isR]
+    rows = [pR, nR, pR, nR]
+    cols = [pR, nR, nR, pR]
+    vals = [gR, gR, -gR, -gR]
+
+    # Voltage source (and inductor) handling: +-1 entries in B and BT
+    isV = (kind == KIND_V) | (kind == KIND_L)
+    pV = pIdx[isV]
+    nV = nIdx[isV]
+    bV = N + ckt.vIdx[isV]
+    ones = np.ones(len(bV))
+    rows += [pV, bV, nV, bV]
+    cols += [bV, pV, bV, nV]
+    vals += [ones, ones, -ones, -ones]
+
+    # A capacitor is open at DC, so a node reached only through
+    # capacitors would get an all-zero row; tie it to ground by GMIN
+    isC = kind == KIND_C
+    capOnly = np.zeros(N + 1, dtype=bool)  # the extra entry is ground
+    capOnly[pIdx[isC]] = True
+    capOnly[nIdx[isC]] = True
+    capOnly[pIdx[~isC]] = False
+    capOnly[nIdx[~isC]] = False
+    gminNodes = np.union1d(np.flatnonzero(capOnly[:N]), ckt.gminNodes)
+    rows.append(gminNodes)
+    cols.append(gminNodes)
+    vals.append(np.full(len(gminNodes), GMIN))
+
+    # N-port macromodels: a dense P x P block Y on the port nodes of each
+    # instance, and their port currents J into the right hand side
+    macroNodes = []
+    macroJ = []
+    for (model, nodes) in ckt.macromodels:
+        P = len(model.ports)
+        rows.append(np.repeat(nodes, P, axis=1).ravel())
+        cols.append(np.tile(nodes, (1, P)).ravel())
+        vals.append(np.tile(model.Y.ravel(), len(nodes)))
+        macroNodes.append(nodes.ravel())
+        macroJ.append(np.tile(model.J, len(nodes)))
+
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    vals = np.concatenate(vals)
+    # Ground is not in the matrix, so drop any entry on a -1 row/column
+    onMatrix = (rows >= 0) & (cols >= 0)
+
+    # Current source handling: out of pNode, into nNode
+    isI = kind == KIND_I
+    pI = pIdx[isI]
+    nI = nIdx[isI]
+    iI = value[isI]
+    vectorI = (scatterSum(nI[nI >= 0], iI[nI >= 0], N)
+               - scatterSum(pI[pI >= 0], iI[pI >= 0], N))
+    for (nodes, J) in zip(macroNodes, macroJ):
+        vectorI = vectorI + scatterSum(nodes[nodes >= 0], J[nodes >= 0], N)
+
+    # an inductor keeps its 0 on the v-source part of the RHS
+    isV = kind == KIND_V
+    vectorE = np.zeros(M, dtype=value.dtype)
+    vectorE[ckt.vIdx[isV]] = value[isV]
+
+    return (rows[onMatrix], cols[onMatrix], vals[onMatrix],
+            np.concatenate((vectorI, vectorE)))
+
+
+def stampReactive(ckt):
+    """Stamp the reactive part of Circuit ckt, i.e. the (row, column,
+       value) triplets of matrix E in the frequency-domain MNA equation
+          (A + jw * E) * X = Z
+       where A and Z come from stampTriplets(). A capacitor C adds +-C
+       entries like a resistor's +-1/R, and an inductor L adds -L onto
+       the D part, making its branch equation V(p) - V(n) - jwL * I = 0.
+       In transient analysis, E is the same matrix in front of dX/dt.
+    """
+    N = ckt.N
+    kind, pIdx, nIdx, value = ckt.kind, ckt.pIdx, ckt.nIdx, ckt.value
+
+    isC = kind == KIND_C
+    pC = pIdx[isC]
+    nC = nIdx[isC]
+    cC = value[isC]
+    isL = kind == KIND_L
+    bL = N + ckt.vIdx[isL]
+
+    rows = np.concatenate([pC, nC, pC, nC, bL])
+    cols = np.concatenate([pC, nC, nC, pC, bL])
+    vals = np.concatenate([cC, cC, -cC, -cC, -value[isL]])
+    onMatrix = (rows >= 0) & (cols >= 0)
+    return rows[onMatrix], cols[onMatrix], vals[onMatrix]
+
+
+class TopologyError(ValueError):
+    """A circuit whose DC matrix is singular by its topology alone
+    """
+
+
+class UnionFind:
+    """Disjoint sets of 0 .. size-1, by union by size and path halving,
+       so that a sequence of operations takes near-linear time
+    """
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        """Join the sets of i and j; False if they were one set already
+        """
+        (i, j) = (self.find(i), self.find(j))
+        if i == j:
+            return False
+        if self.size[i] < self.size[j]:
+            (i, j) = (j, i)
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+        return True
+
+
+def dcComponents(ckt, edges):
+    """Component label of each node and ground (the last entry) of the
+       graph of the component table rows in 'edges' (a boolean mask)
+    """
+    N = ckt.N
+    # ground is node N here, instead of -1
+    p = np.where(ckt.pIdx[edges] < 0, N, ckt.pIdx[edges])
+    n = np.where(ckt.nIdx[edges] < 0, N, ckt.nIdx[edges])
+    if sp is not None:
+        graph = sp.coo_matrix((np.ones(len(p)), (p, n)),
+                              shape=(N + 1, N + 1))
+        return connected_components(graph, directed=False)[1]
+    uf = UnionFind(N + 1)
+    for (i, j) in zip(p.tolist(), n.tolist()):
+        uf.union(i, j)
+    return np.array([uf.find(i) for i in range(N + 1)])
+
+
+def checkTopology(ckt, autoGmin=False):
+    """Check the DC topology of Circuit ckt before any matrix is built,
+       in near-linear time, raising a TopologyError that names the nodes
+       and sources at fault:
+       + floating islands: nodes without a DC path to ground through
+         resistors, Z elements, v-sources or inductors (capacitors and
+         current sources are open); capacitor-only nodes are fine, as
+         they get GMIN anyway
+       + current-source cutsets: floating islands fed by current sources,
+         whose currents have no way to flow
+       + v-source loops: v-sources and inductors forming a loop, found by
+         union-find as the first one joining two nodes already joined
+       With autoGmin, floating nodes are tied to ground by GMIN (added to
+       ckt.gminNodes) instead, as SPICE does; v-source loops still raise.
+    """
+    N = ckt.N
+    kind = ckt.kind
+    messages = []
+
+    # v-source loops, one union-find step per v-source or inductor
+    isV = (kind == KIND_V) | (kind == KIND_L)
+    uf = UnionFind(N + 1)
+    tree = {}  # the v-source forest so far, node -> [(node, name)]
+    for i in np.flatnonzero(isV):
+        (p, n) = (int(ckt.pIdx[i]), int(ckt.nIdx[i]))
+        (p, n) = (N if p < 0 else p, N if n < 0 else n)
+        if uf.union(p, n):
+            tree.setdefault(p, []).append((n, ckt.names[i]))
+            tree.setdefault(n, []).append((p, ckt.names[i]))
+            continue
+        # the loop is ckt.names[i] plus the forest path from p to n
+        path = {p: None}
+        queue = [p]
+        while n not in path:
+            node = queue.pop(0)
+            for (other, name) in tree.get(node, []):
+                if other not in path:
+                    path[other] = (node, name)
+                    queue.append(other)
+        (names, node) = ([ckt.names[i]], n)
+        while path[node] is not None:
+            (node, name) = path[node]
+            names.append(name)
+        messages.append("v-sources/inductors %s form a loop"
+                        % ", ".join(names))
+
+    # floating islands: components of the DC graph without ground
+    isC = kind == KIND_C
+    capOnly = np.zeros(N + 1, dtype=bool)
+    capOnly[ckt.pIdx[isC]] = True
+    capOnly[ckt.nIdx[isC]] = True
+    capOnly[ckt.pIdx[~isC]] = False
+    capOnly[ckt.nIdx[~isC]] = False
+    capOnly[N] = False
+    conducts = (kind == KIND_R) | (kind == KIND_Z) | isV
+    label = dcComponents(ckt, conducts)
+    floating = (label[:N] != label[N]) & ~capOnly[:N]
+    for (model, nodes) in ckt.macromodels:
+        # a macromodel connects all of its ports; leave them be
+        floating[nodes[nodes >= 0]] = False
+    if np.any(floating):
+        nodeNames = list(ckt.nodeDict.keys())
+        isI = kind == KIND_I
+        fed = np.zeros(N + 1, dtype=bool)
+        fed[ckt.pIdx[isI]] = True
+        fed[ckt.nIdx[isI]] = True
+        islands = {}
+        for node in np.flatnonzero(floating):
+            islands.setdefault(label[node], []).append(node)
+        for nodes in islands.values():
+            names = ", ".join(nodeNames[k] for k in nodes[:10]) \
+                + (", ..." if len(nodes) > 10 else "")
+            if np.any(fed[nodes]):
+                sources = [ckt.names[i] for i in np.flatnonzero(isI)
+                           if floating[ckt.pIdx[i]] or floating[ckt.nIdx[i]]]
+                what = "a current-source cutset (%s) of nodes" \
+                    % ", ".join(sources)
+            else:
+                what = "floating nodes without a DC path to ground"
+            if not autoGmin:
+                messages.append("%s: %s" % (what, names))
+        if autoGmin:
+            ckt.gminNodes = np.union1d(ckt.gminNodes,
+                                       np.flatnonzero(floating))
+    if messages:
+        raise TopologyError("; ".join(messages))
+
+
+class DCResult:
+    """Result of solve_dc(), kept as NumPy arrays
+       ---
+       + nodeVolt[nodeDict[name]] is the voltage of node 'name'
+       + vsrcCurr[vsrcDict[name]] is the current through v-source 'name'
+       + save()/load() keep it in a binary file pair, see save()
+    """
+
+    def __init__(self, nodeVolt, vsrcCurr, nodeDict, vsrcDict):
+        self.nodeVolt = nodeVolt
+        self.vsrcCurr = vsrcCurr
+        self.nodeDict = nodeDict
+        self.vsrcDict = vsrcDict
+
+    def voltage(self, node):
+        """Voltage of a node by name, ground aliases being 0V
+        """
+        node = node.upper()
+        if not isnotGround(node):
+            return 0.0
+        return float(self.nodeVolt[self.nodeDict[node]])
+
+    def current(self, vsrc):
+        """Current through a v-source by name
+        """
+        return float(self.vsrcCurr[self.vsrcDict[vsrc.upper()]])
+
+    def save(self, baseName, nodes=None):
+        """Write the result into a pair of files, so that other programs
+           read it back without parsing any numbers:
+           + baseName.npy, one raw NumPy array of the node voltages
+             followed by the v-source currents, which np.load() can
+             memory-map (mmap_mode='r') instead of reading it in
+           + baseName.idx, a text index: a 'nodes N vsources M' line,
+             then the N node names and M v-source names in array order
+           Only the nodes listed in 'nodes' are written if given; all
+           v-source currents are always written.
+        """
+        if nodes is None:
+            nodeNames = list(self.nodeDict.keys())
+            nodeVolt = self.nodeVolt
+        else:
+            nodeNames = [n.upper() for n in nodes]
+            nodeVolt = self.nodeVolt[[self.nodeDict[n] for n in nodeNames]]
+        vsrcNames = list(self.vsrcDict.keys())
+        np.save(baseName + ".npy", np.concatenate((nodeVolt, self.vsrcCurr)))
+        with open(baseName + ".idx", "w") as f:
+            f.write("nodes %d vsources %d\n"
+                    % (len(nodeNames), len(vsrcNames)))
+            f.write("".join(name + "\n" for name in nodeNames + vsrcNames))
+
+    @classmethod
+    def load(cls, baseName, mmap=True):
+        """Read a result written by save(); with mmap, the values stay in
+           the .npy file and are paged in only as they are used
+        """
+        with open(baseName + ".idx") as f:
+            (N, M) = (int(w) for w in f.readline().split()[1::2])
+            names = f.read().split("\n")
+        values = np.load(baseName + ".npy", mmap_mode='r' if mmap else None)
+        return cls(values[:N], values[N:N + M],
+                   {name: i for (i, name) in enumerate(names[:N])},
+                   {name: i for (i, name) in enumerate(names[N:N + M])})
+
+
+def solve_dc(ckt, cache=None, ordering='colamd', stats=None, check=True):
+    """DC analysis of Circuit ckt, returning a DCResult.
+       Ordinary NA is used when there is no v-source (M = 0), since the
+       MNA matrix then shrinks to G alone.
+       With a FactorCache, the symbolic analysis of a topology met before
+       is reused. ordering is a key of ORDERINGS. A dict given as stats
+       is filled with LUFactor.stats() and the seconds of each phase.
+       With check, checkTopology() raises a TopologyError on a circuit
+       that would give a singular matrix, before any is factorized.
+    """
+    N = ckt.N
+
+    tc = time.perf_counter()
+    if check:
+        checkTopology(ckt)
+    t0 = time.perf_counter()
+    stampRow, stampCol, stampVal, vectorZ = stampTriplets(ckt)
+
+    # Take a look to these matrix entries?
+    #print(list(zip(stampRow, stampCol, stampVal)))
+    #print(vectorZ)
+
+    t1 = time.perf_counter()
+    factor = factorCircuit(ckt, stampRow, stampCol, stampVal, cache,
+                           ordering)
+    t2 = time.perf_counter()
+    Result = factor.solve(vectorZ)
+    t3 = time.perf_counter()
+
+    if stats is not None:
+        stats.update(factor.stats())
+        stats.update(checkTime=t0 - tc, stampTime=t1 - t0,
+                     factorTime=t2 - t1, solveTime=t3 - t2)
+    return DCResult(Result[:N], Result[N:], ckt.nodeDict, ckt.vsrcDict)
+
+
+def unitSourceRHS(ckt, name):
+    """Right hand side vector of source 'name' set to 1V/1A, with all
+       other sources set to zero. The right hand side of the MNA equation
+       is linear in each source value, so any source change is a multiple
+       of this vector.
+    """
+    i = ckt.compDict[name.upper()]
+    dz = np.zeros(ckt.N + ckt.M)
+    if ckt.kind[i] == KIND_V:
+        dz[ckt.N + ckt.vIdx[i]] = 1
+    elif ckt.kind[i] == KIND_I:
+        # out of pNode, into nNode
+        if ckt.pIdx[i] >= 0:
+            dz[ckt.pIdx[i]] -= 1
+        if ckt.nIdx[i] >= 0:
+            dz[ckt.nIdx[i]] += 1
+    else:
+        raise ValueError("%s is not an independent source" % name)
+    return dz
+
+
+def sweepValues(start, stop, step):
+    """Sweep points from start to stop (inclusive) by step, as .dc does.
+       The step direction follows stop - start, whatever its sign is.
+    """
+    if step == 0:
+        raise ValueError("sweep step must not be zero")
+    step = abs(step) if stop >= start else -abs(step)
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    return start + step * np.arange(count)
+
+
+class DCSweepResult:
+    """Result of dc_sweep(), kept as NumPy arrays with one row per point
+       ---
+       + sweepNames lists the swept sources, the first one varying fastest
+       + sweepVals[p, k] is the value of source sweepNames[k] on point p
+       + nodeVolt[p, nodeDict[name]] is the voltage of node 'name'
+       + vsrcCurr[p, vsrcDict[name]] is the current through v-source 'name'
+    """
+
+    def __init__(self, sweepNames, sweepVals, nodeVolt, vsrcCurr,
+                 nodeDict, vsrcDict):
+        self.sweepNames = sweepNames
+        self.sweepVals = sweepVals
+        self.nodeVolt = nodeVolt
+        self.vsrcCurr = vsrcCurr
+        self.nodeDict = nodeDict
+        self.vsrcDict = vsrcDict
+
+
+def dc_sweep(ckt, sweeps, cache=None, ordering='colamd', check=True):
+    """DC sweep analysis of Circuit ckt, returning a DCSweepResult.
+       sweeps is a list of (source name, array of values); with more than
+       one source, all value combinations are swept and the first source
+       varies fastest, i.e. the inner loop of a .dc card.
+       Only the right hand side changes from point to point, so the matrix
+       is stamped and factorized once, and all points are solved together
+       as one block of right hand side columns.
+       A FactorCache, ordering and check may be given as in solve_dc().
+    """
+    N = ckt.N
+    if check:
+        checkTopology(ckt)
+    stampRow, stampCol, stampVal, vectorZ = stampTriplets(ckt)
+
+    sweepNames = [name.upper() for (name, values) in sweeps]
+    grids = np.meshgrid(*[np.asarray(values, dtype=float)
+                          for (name, values) in sweeps], indexing='ij')
+    # column k holds source k's value on each point, first one fastest
+    sweepVals = np.column_stack([g.ravel(order='F') for g in grids])
+
+    # Z[:, p] = Z0 + sum of (new value - netlist value) * unit RHS
+    blockZ = np.repeat(vectorZ[:, np.newaxis], len(sweepVals), axis=1)
+    for (k, name) in enumerate(sweepNames):
+        delta = sweepVals[:, k] - ckt.value[ckt.compDict[name]]
+        blockZ += np.outer(unitSourceRHS(ckt, name), delta)
+
+    X = factorCircuit(ckt, stampRow, stampCol, stampVal, cache,
+                      ordering).solve(blockZ)
+    return DCSweepResult(sweepNames, sweepVals, X[:N].T, X[N:].T,
+                         ckt.nodeDict, ckt.vsrcDict)
+
+
+def dcCardSweeps(ckt):
+    """Sweeps given by the .dc card of Circuit ckt, in the form of
+       [(source name, values), ...], or None without any .dc card.
+       Both '.dc V1 0 5 0.1' and the nested '.dc V1 0 5 0.1 V2 0 1 0.5'
+       are supported.
+    """
+    for card in ckt.controls:
+        if card[0] == '.DC':
+            fields = card[1:]
+            return [(fields[i], sweepValues(spiceValue(fields[i + 1]),
+                                            spiceValue(fields[i + 2]),
+                                            spiceValue(fields[i + 3])))
+                    for i in range(0, len(fields) - 3, 4)]
+    return None
+
+
+class IncrementalDC:
+    """What-if (ECO) DC solver, which keeps the LU factorization of the MNA
+       matrix of Circuit ckt and re-solves after a few element changes by
+       low-rank updates instead of refactorizing.
+       A resistor (or Z element) between nodes p and n whose conductance
+       changes by dg changes the matrix by dg * u * uT, where u has +1 on
+       row p and -1 on row n. For k changed resistors, with U = [u1 .. uk]
+       and Dg = diag(dg1 .. dgk), the Sherman-Morrison-Woodbury formula
+       gives the new solution from the factorized matrix A as
+          X = A-1 * Z - W * inv(inv(Dg) + UT * W) * UT * A-1 * Z
+       where W = A-1 * U costs one solve per changed resistor, and the
+       k x k matrix in the middle is tiny. Source changes only change Z.
+       ---
+       + update({name: value, ...}) applies changes, returns a DCResult
+       + maxRank: refactorize once more resistors than this differ from
+         the factorized values (the updates get slower than a refactor)
+       + residualTol: refactorize if the relative residual of the updated
+         solution, |A_new * X - Z| / |Z|, exceeds this
+       + rank/residual/refactorCount report the last update
+    """
+
+    maxRank = 32
+    residualTol = 1e-8
+
+    def __init__(self, ckt):
+        self.ckt = ckt
+        self.refactorCount = 0
+        self.refactor()
+
+    def refactor(self):
+        """Stamp and factorize the matrix of the current element values
+        """
+        ckt = self.ckt
+        stampRow, stampCol, stampVal, self.vectorZ = stampTriplets(ckt)
+        self.factor = LUFactor(ckt.N + ckt.M, stampRow, stampCol, stampVal)
+        self.baseValue = ckt.value.copy()
+        self.columnW = {}  # cached A-1 * u of each changed resistor
+        self.refactorCount += 1
+        self.rank = 0
+        self.residual = 0.0
+        self.solution = self.factor.solve(self.vectorZ)
+        return self.result()
+
+    def result(self):
+        """DCResult of the current solution
+        """
+        N = self.ckt.N
+        return DCResult(self.solution[:N], self.solution[N:],
+                        self.ckt.nodeDict, self.ckt.vsrcDict)
+
+    def unitColumn(self, i):
+        """Vector u of table row i, +1 on pNode and -1 on nNode
+        """
+        u = np.zeros(self.factor.size)
+        if self.ckt.pIdx[i] >= 0:
+            u[self.ckt.pIdx[i]] += 1
+        if self.ckt.nIdx[i] >= 0:
+            u[self.ckt.nIdx[i]] -= 1
+        return u
+
+    def pickRows(self, X, rows):
+        """Rows of X picked by node indices, a ground index (-1) picking
+           a row of zeros
+        """
+        Xpad = np.concatenate((X, np.zeros((1,) + X.shape[1:], X.dtype)))
+        return Xpad[rows]
+
+    def update(self, changes):
+        """Apply {component name: new value} changes on the circuit and
+           return the updated DCResult. All changes are checked before any
+           of them is applied, so a rejected update changes nothing.
+        """
+        ckt = self.ckt
+        rows = {}
+        for name in changes.keys():
+            i = ckt.compDict[name.upper()]
+            if ckt.kind[i] not in (KIND_V, KIND_I, KIND_R, KIND_Z):
+                raise ValueError("%s cannot be updated incrementally"
+                                 % name)
+            rows[name] = i
+
+        for (name, value) in changes.items():
+            i = rows[name]
+            if ckt.kind[i] in (KIND_V, KIND_I):
+                # source changes go into the right hand side only
+                self.vectorZ += ((value - ckt.value[i])
+                                 * unitSourceRHS(ckt, name))
+            ckt.setValue(name, value)
+
+        # all resistors differing from the factorized matrix
+        isR = (ckt.kind == KIND_R) | (ckt.kind == KIND_Z)
+        changed = np.flatnonzero(isR & (ckt.value != self.baseValue))
+        if len(changed) > self.maxRank:
+            return self.refactor()
+
+        x = self.factor.solve(self.vectorZ)
+        if len(changed) > 0:
+            dg = 1 / ckt.value[changed] - 1 / self.baseValue[changed]
+            for i in changed:
+                if i not in self.columnW:
+                    self.columnW[i] = self.factor.solve(self.unitColumn(i))
+            W = np.column_stack([self.columnW[i] for i in changed])
+
+            # U has only two nonzeros (+1 on p, -1 on n) per column, so
+            # UT * Y is a difference of rows of Y, never a dense product
+            pU = ckt.pIdx[changed]
+            nU = ckt.nIdx[changed]
+
+            def timesUT(Y):
+                return self.pickRows(Y, pU) - self.pickRows(Y, nU)
+
+            S = np.diag(1 / dg) + timesUT(W)
+            x = x - np.dot(W, np.linalg.solve(S, timesUT(x)))
+
+            # accuracy check: A_new * x = A * x + U * (dg * UT * x),
+            # where U * y scatters +y onto rows p and -y onto rows n
+            y = dg * timesUT(x)
+            Uy = (scatterSum(pU[pU >= 0], y[pU >= 0], self.factor.size)
+                  - scatterSum(nU[nU >= 0], y[nU >= 0], self.factor.size))
+            r = self.factor.dot(x) + Uy - self.vectorZ
+            self.residual = (np.linalg.norm(r)
+                             / max(np.linalg.norm(self.vectorZ), 1e-300))
+            if not self.residual <= self.residualTol:
+                return self.refactor()
+        else:
+            self.residual = 0.0
+
+        self.rank = len(changed)
+        self.solution = x
+        return self.result()
 
+
+class Macromodel:
+    """DC N-port macromodel of a linear sub-network: with its internal
+       nodes (and v-source branches) eliminated, the sub-network acts on
+       the rest of a circuit only through its P ports as
+          I = Y * V - J
+       where V are the port voltages, I the currents flowing into the
+       ports from outside, Y the P x P port conductance matrix and J the
+       port currents due to the sources inside. Stamping it costs P x P
+       entries, whatever the internal size of the sub-network was.
+       ---
+       + ports lists the port node names, in the order of Y and J
+       + key is the content hash of the sub-network it was reduced from
+    """
+
+    def __init__(self, ports, Y, J, key=None):
+        self.ports = list(ports)
+        self.Y = Y
+        self.J = J
+        self.key = key
+
+    @classmethod
+    def fromSubckt(cls, subckt):
+        """Macromodel of a spice_parse.Subckt, reduced to its ports
+        """
+        (names, kind, pIdx, nIdx, value, nodeNames, acValues,
+         waveforms) = subckt.flat()
+        nodes = list(subckt.ports) + nodeNames
+        return reduceToPorts(Circuit(names, kind, pIdx, nIdx, value,
+                                     {n: i for (i, n) in enumerate(nodes)}),
+                             subckt.ports)
+
+
+# Macromodels by the content hash of their sub-networks, so that
+# repeated blocks are reduced only once
+macromodelCache = {}
+
+
+def reduceToPorts(ckt, ports, cache=macromodelCache):
+    """Reduce Circuit ckt to a Macromodel on its nodes named in ports by
+       the Schur complement: with the unknowns split into ports (p) and
+       internal ones (i), the MNA equation
+          [App Api] [Vp]   [Zp + I]
+          [Aip Aii] [Xi] = [Zi    ]
+       gives Y = App - Api * inv(Aii) * Aip and J = Zp - Api * inv(Aii)
+       * Zi, which takes one factorization of Aii and P solves.
+       Models are looked up in cache by the hash of the tables and ports.
+    """
+    ports = [p.upper() for p in ports]
+    h = hashlib.sha1()
+    for table in (ckt.kind, ckt.pIdx, ckt.nIdx, ckt.value):
+        h.update(np.ascontiguousarray(table).tobytes())
+    h.update("\0".join(ports).encode())
+    h.update(np.array([ckt.nodeDict[p] for p in ports]).tobytes())
+    key = h.hexdigest()
+    if cache is not None and key in cache:
+        return cache[key]
+
+    (stampRow, stampCol, stampVal, vectorZ) = stampTriplets(ckt)
+    size = ckt.N + ckt.M
+    P = len(ports)
+    portIdx = np.array([ckt.nodeDict[p] for p in ports], dtype=np.int64)
+    isPort = np.zeros(size, dtype=bool)
+    isPort[portIdx] = True
+    inner = np.flatnonzero(~isPort)
+    # local numbers within the port part and within the internal part
+    local = np.empty(size, dtype=np.int64)
+    local[portIdx] = np.arange(P)
+    local[inner] = np.arange(len(inner))
+    (pRow, pCol) = (isPort[stampRow], isPort[stampCol])
+    (lRow, lCol) = (local[stampRow], local[stampCol])
+
+    dtype = np.result_type(stampVal, vectorZ)
+    App = np.zeros((P, P), dtype=dtype)
+    np.add.at(App, (lRow[pRow & pCol], lCol[pRow & pCol]),
+              stampVal[pRow & pCol])
+    Y = App
+    J = vectorZ[portIdx].astype(dtype)
+    if len(inner) > 0:
+        Api = np.zeros((P, len(inner)), dtype=dtype)
+        np.add.at(Api, (lRow[pRow & ~pCol], lCol[pRow & ~pCol]),
+                  stampVal[pRow & ~pCol])
+        Aip = np.zeros((len(inner), P), dtype=dtype)
+        np.add.at(Aip, (lRow[~pRow & pCol], lCol[~pRow & pCol]),
+                  stampVal[~pRow & pCol])
+        isII = ~pRow & ~pCol
+        factor = LUFactor(len(inner), lRow[isII], lCol[isII],
+                          stampVal[isII])
+        X = factor.solve(np.column_stack((Aip, vectorZ[inner])))
+        Y = App - np.dot(Api, X[:, :P])
+        J = J - np.dot(Api, X[:, P])
+
+    model = Macromodel(ports, Y, J, key)
+    if cache is not None:
+        cache[key] = model
+    return model
+
+
+def jacobiPreconditioner(G):
+    """Jacobi preconditioner of G: r -> inv(diag(G)) * r
+    """
+    invDiag = 1.0 / G.diagonal()
+    return lambda r: invDiag * r
+
+
+def icPreconditioner(G):
+    """Incomplete Cholesky preconditioner IC(0) of G: G ~ L * LT, with L
+       kept on the lower triangle pattern of G, i.e. without any fill-in.
+       Both triangular solves are done by a SuperLU factorization of L
+       itself, which needs no fill either in the natural order.
+    """
+    lower = sp.tril(G, format='csr')
+    lower.sort_indices()
+    N = G.shape[0]
+    indptr = lower.indptr.tolist()
+    indices = lower.indices.tolist()
+    data = lower.data.tolist()
+    valL = [0.0] * len(data)
+    rowL = [None] * N  # row i of L as {column: value}, left of diagonal
+    diagL = [0.0] * N
+    for i in range(N):
+        row = {}
+        for q in range(indptr[i], indptr[i + 1]):
+            (j, a) = (indices[q], data[q])
+            if j < i:
+                # L(i, j) = (G(i, j) - sum of L(i, k) * L(j, k)) / L(j, j)
+                (small, big) = (row, rowL[j]) if len(row) <= len(rowL[j]) \
+                    else (rowL[j], row)
+                dot = sum(v * big[k] for (k, v) in small.items() if k in big)
+                row[j] = valL[q] = (a - dot) / diagL[j]
+            else:
+                pivot = a - sum(v * v for v in row.values())
+                # a breakdown cannot happen on a diagonally dominant G,
+                # but keep the original diagonal if it ever does
+                diagL[i] = valL[q] = np.sqrt(pivot if pivot > 0 else a)
+        rowL[i] = row
+    L = sp.csr_matrix((valL, lower.indices, lower.indptr), shape=(N, N))
+    luL = spla.splu(L.tocsc(), permc_spec='NATURAL', diag_pivot_thresh=0.0,
+                    options={'SymmetricMode': True})
+    return lambda r: luL.solve(luL.solve(r), trans='T')
+
+
+def aggregateNodes(G, theta=0.08):
+    """Group the nodes of G into aggregates of strongly coupled neighbors,
+       i.e. j is a strong neighbor of i if |G(i, j)| >= theta *
+       sqrt(G(i, i) * G(j, j)). Returns the aggregate number of each node
+       and the number of aggregates.
+    """
+    G = G.tocsr()
+    N = G.shape[0]
+    diag = G.diagonal()
+    rows = np.repeat(np.arange(N), np.diff(G.indptr))
+    strong = (G.indices != rows) & (np.abs(G.data) >= theta * np.sqrt(
+        np.abs(diag[rows] * diag[G.indices])))
+    S = sp.csr_matrix((np.ones(np.count_nonzero(strong)),
+                       (rows[strong], G.indices[strong])), shape=(N, N))
+    indptr = S.indptr.tolist()
+    indices = S.indices.tolist()
+
+    aggregate = [-1] * N
+    count = 0
+    # first pass: a node whose strong neighbors are all free becomes the
+    # root of a new aggregate of itself and these neighbors
+    for i in range(N):
+        if aggregate[i] >= 0:
+            continue
+        neighbors = indices[indptr[i]:indptr[i + 1]]
+        if all(aggregate[j] < 0 for j in neighbors):
+            aggregate[i] = count
+            for j in neighbors:
+                aggregate[j] = count
+            count += 1
+    # second pass: the rest join an aggregate of a strong neighbor
+    for i in range(N):
+        if aggregate[i] >= 0:
+            continue
+        for j in indices[indptr[i]:indptr[i + 1]]:
+            if aggregate[j] >= 0:
+                aggregate[i] = aggregate[j]
+                break
+        else:
+            aggregate[i] = count
+            count += 1
+    return np.array(aggregate, dtype=np.int64), count
+
+
+def amgPreconditioner(G, omega=2.0 / 3):
+    """Two-level aggregation multigrid preconditioner of G: one damped
+       Jacobi sweep, a correction from the coarse matrix
+       Gc = PT * G * P, where P interpolates each aggregate as a whole,
+       then one more Jacobi sweep, so that the preconditioner stays
+       symmetric as CG needs. The coarse matrix is factorized directly.
+    """
+    G = G.tocsr()
+    N = G.shape[0]
+    (aggregate, count) = aggregateNodes(G)
+    P = sp.csr_matrix((np.ones(N), (np.arange(N), aggregate)),
+                      shape=(N, count))
+    coarseLU = spla.splu((P.T @ G @ P).tocsc())
+    invDiag = omega / G.diagonal()
+
+    def vcycle(r):
+        z = invDiag * r
+        z += P @ coarseLU.solve(P.T @ (r - G @ z))
+        z += invDiag * (r - G @ z)
+        return z
+    return vcycle
+
+
+# Preconditioners of solve_pcg(), by name
+PRECONDITIONERS = {'jacobi': jacobiPreconditioner,
+                   'ic': icPreconditioner,
+                   'amg': amgPreconditioner}
+
+
+def pcg(G, b, precond, x0=None, tol=1e-10, maxiter=None):
+    """Preconditioned conjugate gradient iteration on G * x = b, where G
+       is SPD and precond(r) applies the preconditioner to a residual.
+       Stops once |b - G * x| <= tol * |b|, or after maxiter iterations.
+       Returns (x, number of iterations, relative residual).
+    """
+    x = np.zeros(len(b)) if x0 is None else np.array(x0, dtype=float)
+    if maxiter is None:
+        maxiter = 10 * len(b)
+    r = b - G @ x
+    bNorm = np.linalg.norm(b)
+    if bNorm == 0:
+        return np.zeros(len(b)), 0, 0.0
+    z = precond(r)
+    p = z.copy()
+    rz = np.dot(r, z)
+    iterations = 0
+    while np.linalg.norm(r) > tol * bNorm and iterations < maxiter:
+        q = G @ p
+        alpha = rz / np.dot(p, q)
+        x += alpha * p
+        r -= alpha * q
+        z = precond(r)
+        rzNew = np.dot(r, z)
+        p = z + (rzNew / rz) * p
+        rz = rzNew
+        iterations += 1
+    return x, iterations, np.linalg.norm(r) / bNorm
+
+
+def solve_pcg(ckt, precond='jacobi', tol=1e-10, maxiter=None, x0=None):
+    """DC analysis of Circuit ckt by preconditioned conjugate gradients
+       instead of LU, for circuits solved by plain NA, i.e. of resistors
+       and current sources only, whose G matrix is symmetric positive
+       definite. Memory stays at a few vectors beyond G itself, so meshes
+       far beyond the reach of a direct factorization can be solved.
+       ---
+       + precond names the preconditioner in PRECONDITIONERS
+       + tol is the relative residual |Z - G * X| / |Z| to reach
+       + maxiter limits the iterations (default: 10 x number of nodes)
+       + x0 warm-starts from a previous DCResult or node voltage array,
+         e.g. the solution before a few values were changed
+       Returns a DCResult, which also has the number of iterations and
+       the final relative residual as .iterations and .residual.
+    """
+    if ckt.M > 0 or np.iscomplexobj(ckt.value):
+        raise ValueError("PCG needs a real NA system, without v-sources, "
+                         "inductors and complex impedances")
+    if sp is None:
+        raise ValueError("PCG needs SciPy sparse matrices")
+    N = ckt.N
+    stampRow, stampCol, stampVal, vectorZ = stampTriplets(ckt)
+    G = sp.coo_matrix((stampVal, (stampRow, stampCol)),
+                      shape=(N, N)).tocsr()
+    if isinstance(x0, DCResult):
+        x0 = x0.nodeVolt
+
+    (x, iterations, residual) = pcg(G, vectorZ, PRECONDITIONERS[precond](G),
+                                   x0, tol, maxiter)
+    res = DCResult(x, np.zeros(0), ckt.nodeDict, ckt.vsrcDict)
+    res.iterations = iterations
+    res.residual = residual
+    return res
+
+
+def formatValue(x):
+    """Text of a result value; a complex impedance (Z element) makes
+       complex results, which are printed as 'real+imagj'
+    """
+    if np.iscomplexobj(x):
+        return "%.6f%+.6fj" % (x.real, x.imag)
+    return "%.6f" % x
+
+
+def main():
+    """Command line entry: solve a netlist file and print the result
+    """
+    parser = argparse.ArgumentParser(
+        description='%(prog)s: DC analysis of a linear circuit by NA/MNA')
+    parser.add_argument(
+        'netlist', nargs='?', help='input circuit file name')
+    parser.add_argument(
+        '--dc', action='store_true',
+        help='run the .dc sweep card of the netlist')
+    parser.add_argument(
+        '--cache-dir', metavar='DIR',
+        help='keep symbolic factorizations in DIR for later runs on the '
+             'same topology')
+    parser.add_argument(
+        '--ordering', choices=list(ORDERINGS), default='colamd',
+        help='fill-reducing column ordering of the sparse LU '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='report matrix size, fill-in and time per phase')
+    parser.add_argument(
+        '--pcg', choices=list(PRECONDITIONERS), metavar='PRECOND',
+        help='solve a circuit without v-sources by conjugate gradients '
+             'preconditioned by PRECOND: %(choices)s')
+    parser.add_argument(
+        '--tol', type=float, default=1e-10,
+        help='relative residual to reach by --pcg (default: %(default)g)')
+    parser.add_argument(
+        '--maxiter', type=int, default=None,
+        help='iteration limit of --pcg (default: 10 x number of nodes)')
+    parser.add_argument(
+        '--macromodel', action='append', default=[], metavar='SUBCKT',
+        help='stamp instances of SUBCKT as its DC port macromodel '
+             '(may be repeated)')
+    parser.add_argument(
+        '--gmin', action='store_true',
+        help='tie floating nodes to ground by GMIN instead of stopping')
+    parser.add_argument(
+        '--save', metavar='BASE',
+        help='write the result into BASE.npy and BASE.idx instead of '
+             'printing it')
+    parser.add_argument(
+        '--nodes', nargs='+', metavar='NODE',
+        help='nodes to write by --save (default: all nodes)')
+    args = parser.parse_args()
+
+    # First, read in circuit file name in command line
+    if args.netlist:
+        netlistFile = args.netlist
+        print("Input circuit file name for analyzing is: %s"
+              % (netlistFile))
+    else:
+        # use raw_input() in Python 2, but input() in Python 3
+        netlistFile = input("Input circuit file name for analyzing: ")
+
+    parseStart = time.perf_counter()
+    ckt = Circuit.fromFile(netlistFile,
+                           [name.upper() for name in args.macromodel])
+    parseTime = time.perf_counter() - parseStart
+    cache = FactorCache(args.cache_dir) if args.cache_dir else None
+
+    # Fail fast, naming the nodes, on a circuit of a singular matrix
+    checkStart = time.perf_counter()
+    try:
+        checkTopology(ckt, autoGmin=args.gmin)
+    except TopologyError as err:
+        print("%s: %s" % (netlistFile, err), file=sys.stderr)
+        sys.exit(1)
+    checkTime = time.perf_counter() - checkStart
+    if len(ckt.gminNodes):
+        nodeNames = list(ckt.nodeDict.keys())
+        print("GMIN added on floating nodes: %s"
+              % ", ".join(nodeNames[k] for k in ckt.gminNodes),
+              file=sys.stderr)
+
+    if args.dc:
+        sweeps = dcCardSweeps(ckt)
+        if sweeps is None:
+            print("No .dc card found in %s" % netlistFile, file=sys.stderr)
+            sys.exit(1)
+        res = dc_sweep(ckt, sweeps, cache, args.ordering, check=False)
+        # one row per sweep point: source values, then node voltages
+        print(*res.sweepNames, *res.nodeDict.keys(), sep="\t")
+        for (vals, volts) in zip(res.sweepVals, res.nodeVolt):
+            print(*["%.6g" % x for x in vals],
+                  *["%.6f" % v for v in volts], sep="\t")
+        return
+
+    stats = {} if args.stats else None
+    if args.pcg:
         try:
-            nN = nodeDict[self.nNode]
-        except KeyError:
-            pass
-
-        if self.name.startswith('R'):  # Resistor handling
-            if isnotGround(self.pNode) and isnotGround(self.nNode):
-                matG[nP][nP] += 1 / value
-                matG[nN][nN] += 1 / value
-                matG[nP][nN] -= 1 / value
-                matG[nN][nP] -= 1 / value
-            elif isnotGround(self.pNode):
-                matG[nP][nP] += 1 / value
-            elif isnotGround(self.nNode):
-                matG[nN][nN] += 1 / value
-
-        if self.name.startswith('I'):  # Current source handling
-            if isnotGround(self.pNode):
-                vecI[nP][0] -= value
-            if isnotGround(self.nNode):
-                vecI[nN][0] += value
-
-        if self.name.startswith('V'):  # Voltage source handling
-            nV = int(vsrcDict[self.name])
-            vecE[nV][0] = value
-            if isnotGround(self.pNode):
-                matB[nP][nV] = 1
-            if isnotGround(self.nNode):
-                matB[nN][nV] = -1
-
-
-# First, read in circuit file name in command line
-if len(sys.argv) > 1:
-    netlistFile = sys.argv[1]
-    print("Input circuit file name for analyzing is: %s" % (netlistFile))
-else:
-    # use raw_input() in Python 2, but input() in Python 3
-    netlistFile = input("Input circuit file name for analyzing: ")
-
-with open(netlistFile) as netlist:
-    # Second, create a component for each line, and store each
-    # component into a list 'circuit', a holding place of all components.
-    # As in SPICE, node names are all case-insensitive! (upper for all)
-    circuit = []
-    for line in netlist.readlines():
-        # Parse the line into a word list
-        wl = line.upper().strip().split()
-        # Create a Component from this line, and add it to circuit
-        # Ignore comments line, ignore line having less than 4 fields
-        if len(wl) >= 4 and not wl[0].startswith(('*', '#')):
-            circuit.append(Component(wl[0], wl[1], wl[2], wl[3]))
-
-    # If any V source met, MNA must be used
-    usingMNA = False
-    for comp in circuit:
-        if comp.name.startswith('V'):
-            usingMNA = True
-            break
-
-    # Create two empty sets for holding node names & v-source names
-    nodeSet = set()
-    vsrcSet = set()
-
-    # Next, record all node names and v-source names in the circuit
-    for comp in circuit:
-        if comp.name.startswith(('R', 'V', 'I')):
-            nodeSet.add(comp.pNode)
-            nodeSet.add(comp.nNode)
-        if comp.name.startswith('V'):
-            vsrcSet.add(comp.name)
-    # All node names are now stored in nodeSet
-    # All v-source names are now stored in vsrcSet
-
-    # However, 0/GND are treated as the same node, not appearing in matrix
-    if '0' in nodeSet:
-        nodeSet.remove('0')
-    if 'GND' in nodeSet:
-        nodeSet.remove('GND')
-
-    # Assign each node and v-source a unique number, beginning from 0
-    # The unique numbers are stored in two Dictionaries{}
-    # A list generated by a set is surely having unique members
-    nodeList = list(nodeSet)
-    vsrcList = list(vsrcSet)
-    nodeDict = {x: nodeList.index(x) for x in nodeList}
-    vsrcDict = {x: vsrcList.index(x) for x in vsrcList}
-
-    # Take a look to the name<->number mapping in dictionary?
-    #print(nodeDict)
-    #print(vsrcDict)
-
-    # Determine the dimensions N, M; i.e., how many nodes, v-sources?
-    N = len(nodeDict)
-    M = len(vsrcDict)
-
-    # Set the final matrix equation, based on NumPy matrix commands
-    #   G    B           VI
-    # [        ] [X] = [    ]
-    #   BT   D           VE
-    # where BT is the transpose of B
-    G = np.zeros([N, N])
-    D = np.zeros([M, M])
-    B = np.zeros([N, M])
-    vectorI = np.zeros([N, 1])
-    vectorE = np.zeros([M, 1])
-    # And, what if we need all above matrices being complex?
-    # NumPy supports complex number operations with such an ease
-
-    # Now construct the nodal Matrix by looping over each component
-    for comp in circuit:
-        comp.matrixFill(G, B, vectorI, vectorE)
-
-    # Take a look to these matrices?
-    #print (G)
-    #print (B)
-    #print (vectorI)
-    #print (vectorE)
-
-    if not usingMNA:  # Ordinary NA used
-        Result = np.dot(np.linalg.inv(G), vectorI)
-    else:  # MNA must be used
-        C = B.T
-        A = np.vstack((np.hstack((G, B)), np.hstack((C, D))))
-        vectorZ = np.vstack((vectorI, vectorE))
-        Result = np.dot(np.linalg.inv(A), vectorZ)
-    # hstack()/vstack() are useful NumPy features
-
-    # Output the result below. Would you try to sort them?
-    for node in nodeDict.keys():
-        print("node %s: %.6fV" % (node, Result[nodeDict[node], 0]))
-
-    if usingMNA:
+            res = solve_pcg(ckt, args.pcg, args.tol, args.maxiter)
+        except ValueError as err:
+            print("%s: %s" % (netlistFile, err), file=sys.stderr)
+            sys.exit(1)
+        if res.residual > args.tol:
+            print("Not converged after %d iterations! (residual %g)"
+                  % (res.iterations, res.residual), file=sys.stderr)
+        stats = None
+    else:
+        res = solve_dc(ckt, cache, args.ordering, stats, check=False)
+
+    if args.save:
+        res.save(args.save, args.nodes)
+        print("Result written into %s.npy and %s.idx"
+              % (args.save, args.save))
+    else:
+        # Output the result below. Would you try to sort them?
+        for node in res.nodeDict.keys():
+            print("node %s: %sV"
+                  % (node, formatValue(res.nodeVolt[res.nodeDict[node]])))
+
+        if ckt.usingMNA:
+            print("------")
+            for vsrc in res.vsrcDict.keys():
+                kindName = "inductor" \
+                    if ckt.kind[ckt.compDict[vsrc]] == KIND_L else "vsource"
+                print("%s %s: %sA"
+                      % (kindName, vsrc,
+                         formatValue(res.vsrcCurr[res.vsrcDict[vsrc]])))
+
+    if args.pcg and args.stats:
+        print("------")
+        print("pcg (%s): %d iterations, relative residual %g"
+              % (args.pcg, res.iterations, res.residual))
+    if stats is not None:
         print("------")
-        for vsrc in vsrcDict.keys():
-            print("vsource %s: %.6fA" % (vsrc, Result[vsrcDict[vsrc] + N, 0]))
+        print("ordering: %s" % args.ordering)
+        print("matrix size: %d, nnz: %d, bandwidth: %d"
+              % (stats['size'], stats['nnz'], stats['bandwidth']))
+        print("fill: predicted %d (envelope), actual %d (L+U)"
+              % (stats['predictedFill'], stats['actualFill']))
+        print("time: parse %.3fs, check %.3fs, stamp %.3fs, factor %.3fs, "
+              "solve %.3fs"
+              % (parseTime, checkTime, stats['stampTime'],
+                 stats['factorTime'], stats['solveTime']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+"""For demonstrating Monte Carlo and corner analysis of the DC operating
+point of a nonlinear circuit, on the Newton engine of iccad_newton.py.
+Process and temperature parameters are drawn from distributions, e.g.
+    --vary IS:lognormal:0.3 --vary VTO:normal:0.02 --vary TEMP:uniform:-40:125
+and applied on top of the per-device model arrays of every diode and
+MOSFET, which keep their own .model values as the nominal ones:
+  + IS, N: factors on the saturation current and emission coefficient
+    of diodes
+  + KP: a factor on the transconductance of MOSFETs
+  + VTO: a shift (V) of the threshold magnitude of MOSFETs
+  + TEMP: the temperature (C), which scales the thermal voltage and IS
+    of diodes as SPICE does, from the nominal 27C
+With --corners, every combination of each parameter at its low and high
+end (+-3 sigma, or the range of a uniform one) is solved instead.
+The nominal operating point is solved once; every sample then starts
+from it, which is only a small parameter change away, and is solved
+from scratch only when that does not converge. The samples are spread
+across a pool of worker processes, to which the parsed circuit is
+handed over only once per worker. Per-node mean, sigma and quantiles
+are reported, with the throughput in samples per second.
+"""
+
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import iccad_newton
+
+# The parameters which can be varied, by name: their nominal value, and
+# whether a sample multiplies the model value (or else is a shift or, for
+# TEMP, the value itself)
+PARAMETERS = {'IS': (1.0, True), 'N': (1.0, True), 'KP': (1.0, True),
+              'VTO': (0.0, False), 'TEMP': (27.0, False)}
+
+# Temperature dependence of diode IS, as the SPICE defaults of a silicon
+# diode: band gap EG (eV) and the IS temperature exponent XTI
+EG = 1.11
+XTI = 3.0
+KELVIN = 273.15
+
+# Corners of normal and lognormal parameters are at this many sigmas
+CORNER_SIGMAS = 3.0
+
+# Quantiles of the node voltages reported by MCResult
+QUANTILES = (0.01, 0.05, 0.5, 0.95, 0.99)
+
+
+class Variation:
+    """A varied model parameter and its distribution
+       ---
+       + name is a key of PARAMETERS
+       + dist is 'normal' (args: sigma), 'lognormal' (args: sigma of its
+         log; factors only) or 'uniform' (args: low, high), the first two
+         around the nominal value of the parameter
+    """
+
+    def __init__(self, name, dist, *args):
+        self.name = name.upper()
+        self.dist = dist.lower()
+        self.args = [float(a) for a in args]
+        if self.name not in PARAMETERS:
+            raise ValueError("unknown parameter %s, not one of %s"
+                             % (name, ", ".join(PARAMETERS)))
+        (self.nominal, factor) = PARAMETERS[self.name]
+        counts = {'normal': 1, 'lognormal': 1, 'uniform': 2}
+        if counts.get(self.dist) != len(self.args):
+            raise ValueError("%s: distribution %s needs %s argument(s)"
+                             % (self.name, dist, counts.get(self.dist, '?')))
+        if self.dist == 'lognormal' and not factor:
+            raise ValueError("%s is not a factor, so it cannot be lognormal"
+                             % self.name)
+
+    @classmethod
+    def parse(cls, text):
+        """A Variation from text like IS:lognormal:0.3 or TEMP:uniform:0:85
+        """
+        fields = text.split(':')
+        if len(fields) < 3:
+            raise ValueError("%s: expected NAME:DIST:ARGS" % text)
+        return cls(*fields)
+
+    def sample(self, rng, count):
+        """count random values of the parameter, drawn by Generator rng
+        """
+        if self.dist == 'normal':
+            return rng.normal(self.nominal, self.args[0], count)
+        if self.dist == 'lognormal':
+            return self.nominal * np.exp(rng.normal(0, self.args[0], count))
+        return rng.uniform(self.args[0], self.args[1], count)
+
+    def corners(self):
+        """The (low, high) ends of the parameter
+        """
+        if self.dist == 'normal':
+            spread = CORNER_SIGMAS * self.args[0]
+            return (self.nominal - spread, self.nominal + spread)
+        if self.dist == 'lognormal':
+            spread = np.exp(CORNER_SIGMAS * self.args[0])
+            return (self.nominal / spread, self.nominal * spread)
+        return tuple(self.args)
+
+
+def applySample(newton, nominal, names, values):
+    """Set the model arrays of Newton object newton from the nominal ones,
+       a dict of copies of them, with the parameters 'names' at 'values'
+    """
+    sample = {name: PARAMETERS[name][0] for name in PARAMETERS}
+    sample.update(zip(names, values))
+    nVt = nominal['diodeNVt'] * sample['N']
+    Is = nominal['diodeIs'] * sample['IS']
+    # the thermal voltage grows with the absolute temperature, and IS
+    # with both its power XTI and the band gap term
+    ratio = (sample['TEMP'] + KELVIN) / (PARAMETERS['TEMP'][0] + KELVIN)
+    emission = nVt / iccad_newton.Vt_dmodel
+    nVt = nVt * ratio
+    Is = Is * ratio ** (XTI / emission) * np.exp((ratio - 1) * EG / nVt)
+    newton.diodeIs = Is
+    newton.diodeNVt = nVt
+    newton.diodeVcrit = iccad_newton.vcrit(Is, nVt)
+
+    params = dict(nominal['mosParams'])
+    # VTO is kept in the NMOS frame, so a shift of the threshold
+    # magnitude is one of the same sign for NMOS and PMOS alike
+    params['VTO'] = params['VTO'] + sample['VTO']
+    params['BETA'] = params['BETA'] * sample['KP']
+    newton.mosParams = params
+
+
+def nominalModels(newton):
+    """The per-device model arrays of Newton object newton, as applySample()
+       starts from
+    """
+    return {'diodeIs': newton.diodeIs.copy(),
+            'diodeNVt': newton.diodeNVt.copy(),
+            'mosParams': {k: v.copy() for (k, v) in newton.mosParams.items()}}
+
+
+def solveSamples(newton, nominal, X0, names, values, maxIter, strategy):
+    """Solve the samples values[s, k] of parameters 'names', each one from
+       the nominal solution X0. Returns (solutions, one row per sample, NaN
+       where not converged, number of Newton iterations, number of
+       samples solved from scratch)
+    """
+    solutions = np.full((len(values), newton.size), np.nan)
+    (iterations, coldStarts) = (0, 0)
+    with np.errstate(over='ignore', invalid='ignore'):
+        for (s, vals) in enumerate(values):
+            applySample(newton, nominal, names, vals)
+            newton.stats = newton.newStats(strategy)
+            X = X0.copy()
+            newton.vdLimited = newton.diodeVoltages(X)
+            if not newton.iterate(X, maxIter, strategy):
+                coldStarts += 1
+                X = newton.coldStart(maxIter, strategy)
+            if X is not None:
+                solutions[s] = X
+            iterations += newton.stats['iterations']
+    return (solutions, iterations, coldStarts)
+
+
+# Runs with fewer (matrix size x samples) than this are solved in this
+# process when the number of processes is not given
+POOL_MIN_WORK = 20000
+
+# The Newton object, its nominal model arrays and solution of a worker
+# process, which are handed over only once per worker by the pool
+# initializer, not once per chunk of samples
+workerNewton = None
+workerNominal = None
+workerX0 = None
+
+
+def initWorker(newton, X0):
+    global workerNewton, workerNominal, workerX0
+    workerNewton = newton
+    workerNominal = nominalModels(newton)
+    workerX0 = X0
+
+
+def solveChunk(args):
+    (names, values, maxIter, strategy) = args
+    return solveSamples(workerNewton, workerNominal, workerX0, names, values,
+                        maxIter, strategy)
+
+
+class MCResult:
+    """Result of monte_carlo() or corners(), kept as NumPy arrays with one
+       row per sample
+       ---
+       + names are the varied parameters, and samples[s, k] is the value
+         of names[k] in sample s
+       + nodeVolt[s, nodeDict[name]] is the voltage of node 'name', and
+         vsrcCurr[s, vsrcDict[name]] the current through v-source 'name',
+         both NaN where sample s did not converge (see failed)
+       + mean, sigma are per-node arrays over the converged samples, and
+         quantiles[q, node] is the QUANTILES[q] quantile
+       + nominal is the DCResult of the nominal parameters
+       + samplesPerSecond, iterations and coldStarts are of all samples
+    """
+
+    def __init__(self, names, samples, solutions, newton, nominal):
+        N = newton.ckt.N
+        self.names = names
+        self.samples = samples
+        self.nodeVolt = solutions[:, :N]
+        self.vsrcCurr = solutions[:, N:]
+        self.nodeDict = newton.ckt.nodeDict
+        self.vsrcDict = newton.vsrcDict
+        self.nominal = nominal
+        self.failed = ~np.all(np.isfinite(solutions), axis=1)
+        good = self.nodeVolt[~self.failed]
+        if len(good):
+            self.mean = good.mean(axis=0)
+            self.sigma = good.std(axis=0, ddof=1 if len(good) > 1 else 0)
+            self.quantiles = np.quantile(good, QUANTILES, axis=0)
+        else:
+            self.mean = self.sigma = np.full(N, np.nan)
+            self.quantiles = np.full((len(QUANTILES), N), np.nan)
+        self.samplesPerSecond = None
+        self.iterations = 0
+        self.coldStarts = 0
+
+
+def runSamples(newton, names, samples, processes=None, maxIter=100,
+               strategy='full'):
+    """Solve the parameter samples[s, k] of 'names' on Newton object
+       newton, returning an MCResult. The nominal point is solved first,
+       and every sample starts from it. The samples are solved by a pool
+       of 'processes' worker processes; with processes=1 they are solved
+       one by one in this process. If processes is None, all CPU cores are
+       used, unless the run is too small (see POOL_MIN_WORK) to gain.
+    """
+    newton.verbose = False
+    (nominal, iterations) = newton.solve(maxIter, strategy)
+    if nominal is None:
+        raise RuntimeError("the nominal operating point did not converge")
+    X0 = np.concatenate([nominal.nodeVolt, nominal.vsrcCurr])
+
+    if processes is None:
+        # starting worker processes costs more than a small run
+        if newton.size * len(samples) < POOL_MIN_WORK:
+            processes = 1
+        else:
+            processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(samples)))
+
+    t0 = time.perf_counter()
+    if processes <= 1:
+        models = nominalModels(newton)
+        parts = [solveSamples(newton, models, X0, names, samples, maxIter,
+                              strategy)]
+        # the samples leave their models on newton; put the nominal back
+        applySample(newton, models, [], [])
+    else:
+        # a few chunks per worker keeps them all busy till the end
+        chunks = np.array_split(samples, processes * 4)
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=initWorker,
+                                 initargs=(newton, X0)) as pool:
+            parts = list(pool.map(solveChunk,
+                                  [(names, c, maxIter, strategy)
+                                   for c in chunks if len(c)]))
+    seconds = time.perf_counter() - t0
+
+    solutions = np.vstack([p[0] for p in parts])
+    res = MCResult(names, samples, solutions, newton, nominal)
+    res.samplesPerSecond = len(samples) / seconds if seconds > 0 else np.inf
+    res.iterations = sum(p[1] for p in parts)
+    res.coldStarts = sum(p[2] for p in parts)
+    return res
+
+
+def monte_carlo(newton, variations, count, seed=None, **kwargs):
+    """Monte Carlo analysis of Newton object newton: 'count' samples of
+       the Variation list 'variations', drawn with random seed 'seed'.
+       Other arguments are passed to runSamples(), which gives the MCResult
+    """
+    rng = np.random.default_rng(seed)
+    names = [v.name for v in variations]
+    samples = np.column_stack([v.sample(rng, count) for v in variations])
+    return runSamples(newton, names, samples, **kwargs)
+
+
+def corners(newton, variations, **kwargs):
+    """Corner analysis of Newton object newton: every combination of the
+       low and high ends of each of the Variation list 'variations'.
+       Other arguments are passed to runSamples(), which gives the MCResult
+    """
+    names = [v.name for v in variations]
+    grids = np.meshgrid(*[v.corners() for v in variations], indexing='ij')
+    samples = np.column_stack([g.ravel() for g in grids])
+    return runSamples(newton, names, samples, **kwargs)
+
+
+def main():
+    """Command line entry: Monte Carlo or corner analysis of a netlist file
+    """
+    parser = argparse.ArgumentParser(
+        description='%(prog)s: Monte Carlo and corner analysis of the DC '
+                    'operating point of a nonlinear circuit')
+    parser.add_argument(
+        'netlist', help='input circuit file name')
+    parser.add_argument(
+        '--vary', action='append', metavar='NAME:DIST:ARGS', default=[],
+        help='a varied parameter (%s) and its distribution: normal:SIGMA, '
+             'lognormal:SIGMA or uniform:LOW:HIGH; may be repeated'
+             % ", ".join(PARAMETERS))
+    parser.add_argument(
+        '-n', '--samples', type=int, default=1000,
+        help='number of Monte Carlo samples (default: %(default)s)')
+    parser.add_argument(
+        '--corners', action='store_true',
+        help='solve all corners of the varied parameters instead')
+    parser.add_argument(
+        '--seed', type=int, default=None,
+        help='random seed of the samples')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: all CPU cores)')
+    parser.add_argument(
+        '-s', '--strategy', choices=list(iccad_newton.STRATEGIES),
+        default='full', help='Newton step strategy (default: %(default)s)')
+    parser.add_argument(
+        '--maxiter', type=int, default=100,
+        help='most Newton iterations per sample (default: %(default)s)')
+    parser.add_argument(
+        '--nodes', nargs='+', metavar='NODE',
+        help='nodes to print (default: all nodes)')
+    args = parser.parse_args()
+
+    try:
+        variations = [Variation.parse(text) for text in args.vary]
+    except ValueError as err:
+        parser.error(str(err))
+    if not variations:
+        parser.error("no --vary parameter given")
+
+    newton = iccad_newton.Newton(args.netlist)
+    options = dict(processes=args.jobs, maxIter=args.maxiter,
+                   strategy=args.strategy)
+    try:
+        if args.corners:
+            res = corners(newton, variations, **options)
+        else:
+            res = monte_carlo(newton, variations, args.samples,
+                              seed=args.seed, **options)
+    except RuntimeError as err:
+        print("%s: %s" % (args.netlist, err), file=sys.stderr)
+        sys.exit(1)
+
+    print("%d samples, %d failed, %d solved from scratch, %.1f iterations "
+          "per sample, %.1f samples/s"
+          % (len(res.samples), np.count_nonzero(res.failed), res.coldStarts,
+             res.iterations / len(res.samples), res.samplesPerSecond),
+          file=sys.stderr)
+
+    nodes = [n.upper() for n in args.nodes] if args.nodes \
+        else list(res.nodeDict.keys())
+    print("NODE", "NOMINAL", "MEAN", "SIGMA",
+          *["Q%g" % (100 * q) for q in QUANTILES], sep="\t")
+    for node in nodes:
+        i = res.nodeDict[node]
+        print(node, *["%.6g" % v for v in
+                      [res.nominal.nodeVolt[i], res.mean[i], res.sigma[i]]
+                      + list(res.quantiles[:, i])], sep="\t")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,61 +1,184 @@
 #!/usr/bin/env python
 """For demonstrating the usage of Newton's Method (Newton Raphson Method)
 to solve DC operating point of a circuit with non-linear components.
-The only supported non-linear device here is a certain kind model of diode.
-All the derivative linear DC analysis jobs of the Newton's iterations are
-passed to another demo program iccad_mna.py.
+The supported non-linear devices are a certain kind model of diode, whose
+IS and N are read from the .model card named on each diode card, and
+MOSFETs of level 1 and level 3 style models; E sources (VCVS) are
+supported as well. With --dc, the .dc card is swept, each point started
+from the solution of the one before.
+All diodes are evaluated at once on arrays of their parameters, and
+their voltages are limited between iterations as SPICE does (pnjlim).
+The linear part of the circuit is stamped only once, by iccad_mna.py;
+each Newton iteration then adds the linear companion model (G_eq, I_eq)
+of every diode onto a copy of it, i.e. onto the Jacobian matrix and the
+right hand side, and solves it, all in memory, without any netlist file
+written or any program run in between.
+Besides plain Newton, which factorizes a fresh Jacobian on every
+iteration, the steps may be taken by modified (chord) Newton, Broyden's
+rank-1 updates, or Newton damped by a line search; '-s all' compares
+their iterations, factorizations and time on the same circuit.
+When Newton fails to converge, gmin stepping and then source stepping
+(continuation from an easier circuit) are tried before giving up.
+An iteration has converged when the node voltages moved less than 1uV
+and the KCL residual of every node is below 1nA. With --trace, every
+iteration is logged as a JSON line: its largest voltage change, its
+residual, damping, the diode limited most, and the seconds spent on
+evaluating the devices, stamping and solving.
 """
 
 import sys
-import math
-import os
 import re
+import json
+import time
+import argparse
+import numpy as np
+
+import spice_parse
+import iccad_mna as mna
 
 # The theory of linear companion model of diode is based on,
 # http://ecircuitcenter.com/SpiceTopics/Non-Linear%20Analysis/Non-Linear%20Analysis.htm
-# choose Is and Vt of the certain diode model the two values below:
+# A diode without a .model card of its model name takes Is and Vt below;
+# a .model card gives IS and the emission coefficient N, i.e. N * Vt
 Is_dmodel = 1e-14  # i.e. 10fA
 Vt_dmodel = 0.026  # i.e. 26mV
 
-# 4 diode formula functions defined below
-def I_d(V_d):
-    return Is_dmodel * (math.exp(V_d / Vt_dmodel) - 1)
+# 4 diode formula functions defined below; each takes a scalar or an
+# array of diode voltages V_d, with Is and nVt scalars or arrays as well,
+# so that all diodes are evaluated by one call
+def I_d(V_d, Is=Is_dmodel, nVt=Vt_dmodel):
+    return Is * np.expm1(V_d / nVt)
+
+def G_eq(V_d, Is=Is_dmodel, nVt=Vt_dmodel):
+    return Is / nVt * np.exp(V_d / nVt)
+
+def R_eq(V_d, Is=Is_dmodel, nVt=Vt_dmodel):
+    return 1.0 / G_eq(V_d, Is, nVt)
+
+def I_eq(V_d, Is=Is_dmodel, nVt=Vt_dmodel):
+    return I_d(V_d, Is, nVt) - G_eq(V_d, Is, nVt) * V_d
 
-def G_eq(V_d):
-    return Is_dmodel / Vt_dmodel * math.exp(V_d / Vt_dmodel)
+def vcrit(Is=Is_dmodel, nVt=Vt_dmodel):
+    # the critical voltage where the diode's I-V curve turns fastest,
+    # i.e. of the minimum radius of curvature, as in SPICE
+    return nVt * np.log(nVt / (np.sqrt(2) * Is))
 
-def R_eq(V_d):
-    return 1.0 / G_eq(V_d)
+def pnjlim(vnew, vold, nVt, vcrit):
+    # SPICE's junction voltage limiting, on arrays: a new diode voltage
+    # above vcrit which moved more than 2 * nVt is pulled back onto the
+    # log of how far the exponential current would have moved
+    vnew = np.array(vnew, dtype=float)
+    limit = (vnew > vcrit) & (np.abs(vnew - vold) > 2 * nVt)
+    arg = 1 + (vnew - vold) / nVt
+    fromOn = limit & (vold > 0)
+    along = fromOn & (arg > 0)
+    vnew[along] = vold[along] + nVt[along] * np.log(arg[along])
+    vnew[fromOn & (arg <= 0)] = vcrit[fromOn & (arg <= 0)]
+    fromOff = limit & (vold <= 0)
+    vnew[fromOff] = nVt[fromOff] * np.log(vnew[fromOff] / nVt[fromOff])
+    return vnew
 
-def I_eq(V_d):
-    return I_d(V_d) - G_eq(V_d) * V_d
+
+# MOSFET model parameters and their SPICE defaults; level 1 is the
+# Shichman-Hodges model, and level 3 adds the mobility reduction THETA
+# and the drain-induced threshold shift ETA to it
+MOS_DEFAULTS = {'VTO': 0.0, 'KP': 2e-5, 'GAMMA': 0.0, 'PHI': 0.6,
+                'LAMBDA': 0.0, 'THETA': 0.0, 'ETA': 0.0, 'TOX': 1e-7}
+EPS_OX = 3.453e-11  # permittivity of SiO2, F/m
+
+def mosfetEval(vgs, vds, vbs, p):
+    # Drain current and its derivatives gm, gds, gmb of NMOS devices, on
+    # arrays, with vds >= 0 (PMOS devices and swapped source/drain are
+    # mapped onto this by the caller); p maps parameter names to arrays,
+    # where BETA is KP * W / L and SIGMA the threshold shift per Vds
+    # the body effect stops short of a forward biased bulk junction
+    depleted = p['PHI'] - vbs > 1e-3
+    sqrtPhiBs = np.sqrt(np.where(depleted, p['PHI'] - vbs, 1e-3))
+    vth = p['VTO'] + p['GAMMA'] * (sqrtPhiBs - np.sqrt(p['PHI'])) \
+        - p['SIGMA'] * vds
+    on = vgs > vth
+    vov = np.where(on, vgs - vth, 0.0)
+    beta = p['BETA'] / (1 + p['THETA'] * vov)
+    dBeta = -beta * p['THETA'] / (1 + p['THETA'] * vov)
+    sat = vds >= vov
+    # Id = beta * core * (1 + LAMBDA * vds), core by the region
+    core = np.where(sat, vov * vov / 2, (vov - vds / 2) * vds)
+    dCoreOv = np.where(sat, vov, vds)
+    dCoreDs = np.where(sat, 0.0, vov - vds)
+    clm = 1 + p['LAMBDA'] * vds
+    ids = beta * core * clm
+    # vov rises with vgs, with vds by SIGMA, and with vbs by the body effect
+    dIdOv = clm * (dBeta * core + beta * dCoreOv)
+    gm = dIdOv * on
+    gds = (dIdOv * p['SIGMA'] + beta * clm * dCoreDs
+           + beta * core * p['LAMBDA']) * on
+    gmb = dIdOv * p['GAMMA'] / (2 * sqrtPhiBs) * on * depleted
+    return (ids, gm, gds, gmb)
 
 
 class Newton:
     """
     A Newton Iteration object who has iteration storages and
     calculation methods
+    ---
+    + ckt is the Circuit of all other cards, with the nodes met only on
+      diodes, MOSFETs and E sources appended to it
+    + diodeP/diodeN are the anode/cathode node numbers of found_diodes,
+      and mosD/mosG/mosS/mosB the terminal node numbers of found_mosfets,
+      -1 for ground; mosSign is +1 for NMOS and -1 for PMOS
+    + E sources (VCVS) found_vcvs are linear; each has a branch current
+      unknown after the v-sources of ckt, and vsrcDict maps the names of
+      both to their branch numbers
+    + stampRow/stampCol are the Jacobian triplet positions: the ones of
+      the linear part (with the E sources), then 4 per diode and 8 per
+      MOSFET (those off ground), then the diagonal of every node, and
+      linearVal/linearZ are the linear part's values and right hand side
+    + gshunt is a conductance from every node to ground, and sourceScale
+      scales all independent sources; both are only changed from 0 and 1
+      by the continuation methods
+    + trace, when a NewtonTrace, gets a record of every iteration
     """
     inputFileName = ""  # circuit file name
     parseReady = False
     found_diodes = []  # diode cards in the circuit
+    found_mosfets = []  # MOSFET cards in the circuit
+    found_vcvs = []  # E (voltage controlled voltage source) cards
     non_diode_lines = []  # all other cards in the circuit
-    equ_diode_lines = []  # linearly equivalent Geq and Ieq for diodes
 
-    # initially guess all Vd = 1V
-    # also try like Vd = 0, and compare the converging speeds
-    init_diode_Vd = 1
+    # initially guess each Vd on its critical voltage vcrit, as SPICE
+    # does; also try like Vd = 1 or Vd = 0, and compare the converging
+    # speeds, as well as without limiting junction voltages by pnjlim
+    init_diode_Vd = None
+    limiting = True
 
-    # set absolute voltage tolerance = 1uV to stop iteration; neither
-    # current tolerance nor relative tolerance being considered here
+    # set absolute voltage tolerance = 1uV to stop iteration, and the
+    # KCL residual of every node must be within the absolute current
+    # tolerance = 1nA as well (None for no residual check); relative
+    # tolerances are not considered here
     volt_tolerance = 1e-6
+    current_tolerance = 1e-9
+
+    # Broyden restarts from a freshly factorized Jacobian after this many
+    # rank-1 updates, and the line search halves a step no further than
+    # to this fraction of it
+    BROYDEN_MAX_STEPS = 20
+    MIN_DAMPING = 1.0 / 1024
+
+    # When plain Newton fails, step gmin (a conductance on every node)
+    # down from GMIN_START, or ramp the sources up from 0, taking up to
+    # STEP_MAX_ITER iterations on each continuation step and giving up on
+    # a step shrunk below MIN_STEP
+    continuation = True
+    GMIN_START = 1e-2
+    STEP_MAX_ITER = 20
+    MIN_STEP = 1e-4
+    gshunt = 0.0
+    sourceScale = 1.0
 
-    # node_volt_iter0 and node_volt_iter1 each saves the 1st and 2nd
-    # DC analysis node voltage result for any two consecutive iterations
-    node_volt_iter0 = {"0": 0,
-                       "GND": 0}
-    node_volt_iter1 = {"0": 0,
-                       "GND": 0}
+    verbose = True  # print the guessed diode voltages of each iteration
+    stats = None  # iterations, factorizations and seconds of solve()
+    trace = None  # NewtonTrace of solve() or sweep(), if asked for
+    mosLast = (None, None, None)  # last result of mosfetCurrents()
 
     def __init__(self, fileName=""):
         self.parseReady = False
@@ -74,120 +197,807 @@ class Newton:
                 "Input circuit file name for analyzing: ")
 
     def parseFile(self):
+        # the shared streaming parser drops comments, joins continuation
+        # lines and upper-cases each card into a word list
         with open(self.inputFileName) as netlist:
+            netlist.readline()  # the first line is the title
             self.found_diodes = []
-            for line in netlist.readlines():
-                # parse the line into a word list
-                wl = line.upper().strip().split()
-                # ignore all lines except those beginning with 'd/D'
-                # and having at least 3 fields
+            self.found_mosfets = []
+            self.found_vcvs = []
+            self.non_diode_lines = []
+            (diodeModels, deviceNodes) = ([], [])
+            for wl in spice_parse.netlistCards(netlist):
+                # pick out cards beginning with 'D' and having at
+                # least 3 fields: D name node1 node2 [model [area]]
                 if len(wl) >= 3 and wl[0].startswith('D'):
                     self.found_diodes.append((wl[0], wl[1], wl[2]))
-                else:  # Just pass all other lines to non-diode card list
-                    self.non_diode_lines.append(line.replace("\n", ""))
-            self.parseReady = True
+                    diodeModels.append(wl[3:5])
+                    deviceNodes += wl[1:3]
+                # M name drain gate source bulk model [W=.. L=..]
+                elif len(wl) >= 6 and wl[0].startswith('M'):
+                    self.found_mosfets.append(wl)
+                    deviceNodes += wl[1:5]
+                # E name node+ node- control+ control- gain
+                elif len(wl) >= 6 and wl[0].startswith('E'):
+                    self.found_vcvs.append(wl[:6])
+                    deviceNodes += wl[1:5]
+                else:  # Just pass all other cards to non-diode card list
+                    self.non_diode_lines.append(" ".join(wl))
+        self.ckt = mna.Circuit.fromLines(self.non_diode_lines)
+        # number the nodes met only on devices in order of appearance
+        for node in deviceNodes:
+            self.ckt.addNode(node)
+        self.setDiodeModels(diodeModels)
+        self.setMosfetModels()
+        diodeNodes = [(self.ckt.addNode(dnode1), self.ckt.addNode(dnode2))
+                      for (dname, dnode1, dnode2) in self.found_diodes]
+        (self.diodeP, self.diodeN) = \
+            np.array(diodeNodes, dtype=np.int64).reshape(-1, 2).T
+        self.stampLinear()
+        self.parseReady = True
+
+    def setDiodeModels(self, diodeModels):
+        # per-diode arrays of model parameters, from the .model card
+        # named on each diode card and its area factor
+        (Is, nVt) = ([], [])
+        for ((dname, dnode1, dnode2), fields) in zip(self.found_diodes,
+                                                     diodeModels):
+            (mtype, params) = self.ckt.models.get(
+                fields[0] if fields else None, ('D', {}))
+            if mtype != 'D':
+                raise ValueError("%s: model %s is not a diode model"
+                                 % (dname, fields[0]))
+            area = spice_parse.spiceValue(fields[1].replace('AREA=', '')) \
+                if len(fields) > 1 else 1.0
+            Is.append(params.get('IS', Is_dmodel) * area)
+            nVt.append(params.get('N', 1.0) * Vt_dmodel)
+        self.diodeIs = np.array(Is, dtype=float)
+        self.diodeNVt = np.array(nVt, dtype=float)
+        self.diodeVcrit = vcrit(self.diodeIs, self.diodeNVt)
+
+    def setMosfetModels(self):
+        # per-MOSFET arrays of terminals and model parameters, from the
+        # .model card named on each MOSFET card and its W and L
+        node = self.ckt.addNode
+        (terminals, sign, params) = ([], [], [])
+        for wl in self.found_mosfets:
+            terminals.append([node(n) for n in wl[1:5]])
+            (mtype, model) = self.ckt.models.get(wl[5], (None, {}))
+            if mtype not in ('NMOS', 'PMOS'):
+                raise ValueError("%s: model %s is not a MOSFET model"
+                                 % (wl[0], wl[5]))
+            if model.get('LEVEL', 1) not in (1, 3):
+                print("%s: level %g of model %s is not supported, level 1 "
+                      "is used" % (wl[0], model['LEVEL'], wl[5]),
+                      file=sys.stderr)
+            size = dict(re.findall(r'(\w+)=(\S+)', " ".join(wl[6:])))
+            (w, l) = (spice_parse.spiceValue(size.get('W', '1E-4')),
+                      spice_parse.spiceValue(size.get('L', '1E-4')))
+            p = {k: float(model.get(k, v)) for (k, v) in MOS_DEFAULTS.items()}
+            p['BETA'] = p['KP'] * w / l
+            # level 3 threshold shift per Vds, by the static feedback ETA
+            p['SIGMA'] = p['ETA'] * 8.15e-22 / (EPS_OX / p['TOX'] * l ** 3)
+            # a PMOS device is an NMOS one with all voltages negated
+            sign.append(1.0 if mtype == 'NMOS' else -1.0)
+            p['VTO'] *= sign[-1]
+            params.append(p)
+        (self.mosD, self.mosG, self.mosS, self.mosB) = \
+            np.array(terminals, dtype=np.int64).reshape(-1, 4).T
+        self.mosSign = np.array(sign)
+        self.mosParams = {k: np.array([p[k] for p in params], dtype=float)
+                          for k in list(MOS_DEFAULTS) + ['BETA', 'SIGMA']}
+
+    def stampLinear(self):
+        # The linear part of the Jacobian and the RHS never change, so
+        # stamp them once; each diode adds +-G_eq like a resistor on its
+        # two nodes, and each MOSFET its conductances on its drain and
+        # source rows, the positions of which are fixed as well
+        (rows, cols, self.linearVal, self.linearZ) = \
+            mna.stampTriplets(self.ckt)
+        (N, M, K) = (self.ckt.N, self.ckt.M, len(self.found_vcvs))
+        self.size = N + M + K
+
+        # E source k: branch row N + M + k reads V(p) - V(n) - gain *
+        # (V(cp) - V(cn)) = 0, and its current leaves p, enters n
+        node = self.ckt.addNode
+        (p, n, cp, cn) = np.array([[node(v) for v in wl[1:5]]
+                                   for wl in self.found_vcvs],
+                                  dtype=np.int64).reshape(-1, 4).T
+        gain = np.array([spice_parse.spiceValue(wl[5])
+                         for wl in self.found_vcvs])
+        b = N + M + np.arange(K)
+        ones = np.ones(K)
+        eRows = np.concatenate([p, n, b, b, b, b])
+        eCols = np.concatenate([b, b, p, n, cp, cn])
+        eVals = np.concatenate([ones, -ones, ones, -ones, -gain, gain])
+        eOn = (eRows >= 0) & (eCols >= 0)
+        rows = np.concatenate([rows, eRows[eOn]])
+        cols = np.concatenate([cols, eCols[eOn]])
+        self.linearVal = np.concatenate([self.linearVal, eVals[eOn]])
+        self.linearZ = np.concatenate([self.linearZ, np.zeros(K)])
+        self.vsrcDict = dict(self.ckt.vsrcDict)
+        self.vsrcDict.update((wl[0], M + k)
+                             for (k, wl) in enumerate(self.found_vcvs))
+
+        (p, n) = (self.diodeP, self.diodeN)
+        dRows = np.concatenate([p, n, p, n])
+        dCols = np.concatenate([p, n, n, p])
+        self.diodeOnMatrix = (dRows >= 0) & (dCols >= 0)
+        # MOSFET rows d and s, each on columns g, d, s, b
+        (d, g, s, bulk) = (self.mosD, self.mosG, self.mosS, self.mosB)
+        mRows = np.concatenate([d, d, d, d, s, s, s, s])
+        mCols = np.concatenate([g, d, s, bulk, g, d, s, bulk])
+        self.mosOnMatrix = (mRows >= 0) & (mCols >= 0)
+        nodes = np.arange(N)
+        self.stampRow = np.concatenate([rows, dRows[self.diodeOnMatrix],
+                                        mRows[self.mosOnMatrix], nodes])
+        self.stampCol = np.concatenate([cols, dCols[self.diodeOnMatrix],
+                                        mCols[self.mosOnMatrix], nodes])
+        self.symbolic = None  # column order and CSC layout, once known
+        # the linear part as a matrix, for the residual of the circuit
+        if mna.sp is None:
+            self.linearA = np.zeros([self.size, self.size])
+            np.add.at(self.linearA, (rows, cols), self.linearVal)
+        else:
+            self.linearA = mna.sp.csr_matrix(
+                (self.linearVal, (rows, cols)), shape=(self.size, self.size))
 
     def reportStatus(self):
         if self.parseReady is True:
             print(self.found_diodes)
             print(self.non_diode_lines)
-            print(self.equ_diode_lines)
-            print(self.node_volt_iter0)
-            print(self.node_volt_iter1)
+            print(self.stats)
+
+    def diodeVoltages(self, X):
+        # Vd of every diode from solution X; ground (index -1) reads the
+        # 0V appended after the node voltages
+        volt = np.append(X[:self.ckt.N], 0.0)
+        return volt[self.diodeP] - volt[self.diodeN]
+
+    def mosfetCurrents(self, X):
+        # Current into the drain of every MOSFET on solution X (None for
+        # all 0V), and its Jacobian values on the fixed positions of
+        # stampLinear(). A device whose drain is below its source (above,
+        # for PMOS) works with them swapped, and a GMIN conductance from
+        # drain to source keeps the matrix regular when it is off.
+        # The residual and the Jacobian of an iteration, and the KCL check
+        # of a step and the residual of the next one, are on the same X,
+        # so the last result is kept and reused while X and the model
+        # parameters stay the same.
+        volt = np.zeros(self.ckt.N + 1) if X is None \
+            else np.append(X[:self.ckt.N], 0.0)
+        (vd, vg, vs, vb) = (volt[self.mosD], volt[self.mosG],
+                            volt[self.mosS], volt[self.mosB])
+        terminals = np.concatenate([vd, vg, vs, vb])
+        (lastTerminals, lastParams, lastResult) = self.mosLast
+        if lastParams is self.mosParams \
+                and np.array_equal(terminals, lastTerminals):
+            return lastResult
+        sign = self.mosSign
+        (vgs, vds, vbs) = (sign * (vg - vs), sign * (vd - vs),
+                           sign * (vb - vs))
+        swap = vds < 0
+        (ids, gm, gds, gmb) = mosfetEval(
+            np.where(swap, vgs - vds, vgs), np.abs(vds),
+            np.where(swap, vbs - vds, vbs), self.mosParams)
+        current = np.where(swap, -1, 1) * sign * ids + mna.GMIN * (vd - vs)
+        gds = gds + mna.GMIN
+        total = gm + gds + gmb
+        # the drain row on columns g, d, s, b; the source row is negated
+        drainRow = np.where(swap, [-gm, total, -gds, -gmb],
+                            [gm, gds, -total, gmb])
+        jacobian = np.concatenate([drainRow.ravel(), -drainRow.ravel()])
+        result = (current, jacobian[self.mosOnMatrix])
+        self.mosLast = (terminals, self.mosParams, result)
+        return result
+
+    def stampDiodes(self, vd, X=None):
+        # Stamp values of the Jacobian and the RHS with every diode
+        # linearized on its voltage in array vd: a conductance G_eq, and a
+        # current source I_eq from anode to cathode; and every MOSFET
+        # linearized on solution X. The RHS is the one of the diodes'
+        # companion models only, which is all of it with X=None (all 0V),
+        # where the MOSFETs carry no current; the Newton steps use the
+        # residual instead
+        g = G_eq(vd, self.diodeIs, self.diodeNVt)
+        i = I_eq(vd, self.diodeIs, self.diodeNVt)
+        diodeVal = np.concatenate([g, g, -g, -g])[self.diodeOnMatrix]
+        (mosCurrent, mosVal) = self.mosfetCurrents(X)
+        stampVal = np.concatenate([self.linearVal, diodeVal, mosVal,
+                                   np.full(self.ckt.N, self.gshunt)])
+        vectorZ = self.sourceScale * self.linearZ
+        (p, n, N) = (self.diodeP, self.diodeN, self.ckt.N)
+        vectorZ[:N] += (mna.scatterSum(n[n >= 0], i[n >= 0], N)
+                        - mna.scatterSum(p[p >= 0], i[p >= 0], N))
+        return (stampVal, vectorZ)
+
+    def factorJacobian(self, vd, X=None):
+        # LU factorization of the Jacobian with the diodes linearized on
+        # vd and the MOSFETs on X, and the RHS of stampDiodes(); every
+        # iteration has the same matrix pattern, so only the first one
+        # orders and analyzes the matrix, and the others just refactorize
+        t0 = time.perf_counter()
+        (stampVal, vectorZ) = self.stampDiodes(vd, X)
+        t1 = time.perf_counter()
+        factor = mna.LUFactor(self.size, self.stampRow, self.stampCol,
+                              stampVal, symbolic=self.symbolic,
+                              analyze=self.symbolic is None)
+        self.symbolic = factor.analysis
+        self.stats['factorizations'] += 1
+        self.stats['stampTime'] += t1 - t0
+        self.stats['solveTime'] += time.perf_counter() - t1
+        return (factor, vectorZ)
+
+    def linearSolve(self, factor, F):
+        # forward/back substitution on the factorized Jacobian, timed
+        # together with its factorization as the solve time
+        t0 = time.perf_counter()
+        X = factor.solve(F)
+        self.stats['solveTime'] += time.perf_counter() - t0
+        return X
+
+    def residual(self, X, limit=True):
+        # KCL and branch equation residual F(X) of the nonlinear circuit:
+        # the linear part, plus each diode current I_d leaving its anode
+        # and entering its cathode, and each MOSFET current leaving its
+        # drain and entering its source. With limiting, a diode voltage is
+        # limited by pnjlim() against the one of the last call, kept as
+        # self.vdLimited, and its current is linearized on the limited
+        # voltage, so that the Newton step is the one of SPICE; the diode
+        # limited the most is kept as self.limitedBy
+        t0 = time.perf_counter()
+        vd = self.diodeVoltages(X)
+        (Is, nVt) = (self.diodeIs, self.diodeNVt)
+        if limit and self.limiting:
+            self.vdLimited = pnjlim(vd, self.vdLimited, nVt,
+                                    self.diodeVcrit)
+            va = self.vdLimited
+            cut = np.abs(vd - va)
+            self.limitedBy = self.found_diodes[np.argmax(cut)][0] \
+                if len(cut) and np.max(cut) > 0 else None
+            i = I_d(va, Is, nVt) + G_eq(va, Is, nVt) * (vd - va)
+        else:
+            if limit:
+                self.vdLimited = vd
+            i = I_d(vd, Is, nVt)
+        F = self.linearA.dot(X) - self.sourceScale * self.linearZ
+        (p, n, N) = (self.diodeP, self.diodeN, self.ckt.N)
+        (d, s) = (self.mosD, self.mosS)
+        im = self.mosfetCurrents(X)[0]
+        F[:N] += (mna.scatterSum(p[p >= 0], i[p >= 0], N)
+                  - mna.scatterSum(n[n >= 0], i[n >= 0], N)
+                  + mna.scatterSum(d[d >= 0], im[d >= 0], N)
+                  - mna.scatterSum(s[s >= 0], im[s >= 0], N)
+                  + self.gshunt * X[:N])
+        self.stats['evaluateTime'] += time.perf_counter() - t0
+        return F
 
     def initGuess(self):
-        if self.parseReady is not True:
-            return
-        # guess all diodes working on a predefined initial value
-        self.equ_diode_lines = []
-        for (dname, dnode1, dnode2) in self.found_diodes:
-            self.equ_diode_lines.append("Requ_%s %s %s %e"
-                                        % (dname, dnode1, dnode2,
-                                           R_eq(self.init_diode_Vd)))
-            self.equ_diode_lines.append("Iequ_%s %s %s %e"
-                                        % (dname, dnode1, dnode2,
-                                           I_eq(self.init_diode_Vd)))
-
-    def createLinearFile(self, fName):
-        # create a linearized netlist for DC simulation
-        with open(fName, "w") as f:
-            print(*self.non_diode_lines, sep="\n", file=f)
-            print(*self.equ_diode_lines, sep="\n", file=f)
-
-    def runMNAnalysis(self, finName, foutName):
-        return os.system("python iccad_mna.py %s > %s" % (finName, foutName))
-
-    def readbackNodeResult(self, fName, node_volt_dic):
-        with open(fName) as fout:
-            for line in fout.readlines():
-                if re.match("^node .+", line):
-                    node_args = re.split(" ", line.replace("\n", ""))
-                    n_name = re.sub(":$", "", node_args[1])
-                    n_volt = re.sub("V$", "", node_args[2])
-                    node_volt_dic[n_name] = float(n_volt)  # save voltage
-
-    def continueGuess(self):
-        if self.parseReady is not True:
-            return
-        # apply all diodes's Vd from Iter0 dictionary
-        self.equ_diode_lines = []
-        for (dname, dnode1, dnode2) in self.found_diodes:
-            v1 = self.node_volt_iter0[dnode1]
-            v2 = self.node_volt_iter0[dnode2]
-            vd = v1 - v2
-            print(dname, ": guessed Vd = ", vd)
-            self.equ_diode_lines.append("Requ_%s %s %s %e"
-                                        % (dname, dnode1, dnode2, R_eq(vd)))
-            self.equ_diode_lines.append("Iequ_%s %s %s %e"
-                                        % (dname, dnode1, dnode2, I_eq(vd)))
-
-    def judgeConverged(self):
-        for node in self.node_volt_iter0.keys():
-            if abs(self.node_volt_iter0[node]
-                    - self.node_volt_iter1[node]) > self.volt_tolerance:
-                return False
-        return True
-
-
-# define the file names used for initial guess
-SPICE_net0 = "./newton.iter.0.spice"
-SPICE_out0 = "./newton.iter.0.out"
-
-# define the file names used for continued guess
-SPICE_net1 = "./newton.iter.1.spice"
-SPICE_out1 = "./newton.iter.1.out"
-
-
-littleNewton = Newton()
-littleNewton.inputFile()
-littleNewton.parseFile()
-
-# Give an initial guess first, and then enter Newton Iteration
-littleNewton.initGuess()
-littleNewton.createLinearFile(SPICE_net0)
-ret_code = littleNewton.runMNAnalysis(SPICE_net0, SPICE_out0)
-if ret_code != 0:
-    sys.exit(ret_code)
-littleNewton.readbackNodeResult(SPICE_out0, littleNewton.node_volt_iter0)
-# End of initial guess
-
-iterNum = 0
-while True:
-    littleNewton.continueGuess()
-    littleNewton.createLinearFile(SPICE_net1)
-    ret_code = littleNewton.runMNAnalysis(SPICE_net1, SPICE_out1)
-    if ret_code != 0:
-        sys.exit(ret_code)
-    littleNewton.readbackNodeResult(SPICE_out1, littleNewton.node_volt_iter1)
-    iterNum += 1
-    if littleNewton.judgeConverged():
-        print("Converged after", iterNum, "times. See result in", SPICE_out1)
-        break
-    if iterNum > 100:
+        # guess all diodes working on a predefined initial value, or on
+        # their critical voltages, and solve the circuit linearized there
+        # for the first solution
+        if self.init_diode_Vd is None:
+            vd = self.diodeVcrit.copy()
+        else:
+            vd = np.full(len(self.found_diodes), float(self.init_diode_Vd))
+        self.vdLimited = vd
+        (factor, vectorZ) = self.factorJacobian(vd)
+        return self.linearSolve(factor, vectorZ)
+
+    def converged(self, dX, X=None):
+        # node voltages moved no more than the tolerance, and the KCL
+        # residual of the new solution X on every node, the current left
+        # over there, is within the current tolerance; the largest one is
+        # kept as self.kclNorm
+        N = self.ckt.N
+        if not np.all(np.abs(dX[:N]) <= self.volt_tolerance):
+            return False
+        if X is None or self.current_tolerance is None:
+            return True
+        self.kclNorm = self.kclResidual(X)
+        return self.kclNorm <= self.current_tolerance
+
+    def kclResidual(self, X):
+        # the largest current left over on any node by solution X
+        F = self.residual(X, limit=False)[:self.ckt.N]
+        return float(np.max(np.abs(F))) if len(F) else 0.0
+
+    def reportGuess(self, X):
+        if self.verbose:
+            for ((dname, dnode1, dnode2), v) in zip(self.found_diodes,
+                                                    self.diodeVoltages(X)):
+                print(dname, ": guessed Vd = ", v)
+
+    def result(self, X):
+        """DCResult of solution vector X of the circuit
+        """
+        N = self.ckt.N
+        return mna.DCResult(X[:N], X[N:], self.ckt.nodeDict, self.vsrcDict)
+
+    def fullSteps(self, X):
+        # Newton: a fresh Jacobian on every iteration
+        while True:
+            F = self.residual(X)
+            (factor, vectorZ) = self.factorJacobian(self.vdLimited, X)
+            yield -self.linearSolve(factor, F)
+
+    def modifiedSteps(self, X):
+        # Modified (chord) Newton: keep the factorized Jacobian as long as
+        # the steps keep shrinking at least as fast as before, i.e. the
+        # contraction rate |dX(k)| / |dX(k-1)| does not get worse
+        (factor, fresh, lastNorm, lastRate) = (None, True, None, None)
+        while True:
+            F = self.residual(X)
+            if factor is None:
+                (factor, vectorZ) = self.factorJacobian(self.vdLimited, X)
+            dX = -self.linearSolve(factor, F)
+            norm = np.max(np.abs(dX))
+            rate = norm / lastNorm if lastNorm else None
+            if not fresh and rate is not None \
+                    and (rate >= 1 or (lastRate and rate > lastRate)):
+                (factor, vectorZ) = self.factorJacobian(self.vdLimited, X)
+                dX = -self.linearSolve(factor, F)
+                (norm, rate) = (np.max(np.abs(dX)), None)
+                fresh = True
+            else:
+                fresh = False
+            (lastNorm, lastRate) = (norm, rate)
+            yield dX
+
+    def broydenSteps(self, X):
+        # Broyden's (good) method on the factorized Jacobian J0 of the
+        # first point: its rank-1 updates are applied to J0's inverse as
+        # a recursion over the steps taken (C.T. Kelley, Iterative Methods
+        # for Linear and Nonlinear Equations, 1995, algorithm brsol), so
+        # that only J0 is ever factorized. It restarts from a fresh J0
+        # when a step grows, or after BROYDEN_MAX_STEPS updates.
+        steps = []
+        while True:
+            F = self.residual(X)
+            if not steps:
+                (factor, vectorZ) = self.factorJacobian(self.vdLimited, X)
+                norms2 = []
+            z = -self.linearSolve(factor, F)
+            if steps:
+                for j in range(len(steps) - 1):
+                    z += steps[j + 1] * (np.dot(steps[j], z) / norms2[j])
+                denom = 1 - np.dot(steps[-1], z) / norms2[-1]
+                dX = z / denom if denom != 0 else z
+                if (np.dot(dX, dX) > norms2[-1]
+                        or len(steps) >= self.BROYDEN_MAX_STEPS):
+                    steps = []
+                    continue
+            else:
+                dX = z
+            steps.append(dX)
+            norms2.append(np.dot(dX, dX))
+            yield dX
+
+    def lineSearchSteps(self, X):
+        # Damped Newton: a fresh Jacobian on every iteration, and the
+        # step halved until the residual norm decreases enough (Armijo)
+        while True:
+            F = self.residual(X)
+            (factor, vectorZ) = self.factorJacobian(self.vdLimited, X)
+            dX = -self.linearSolve(factor, F)
+            normF = np.linalg.norm(self.residual(X, limit=False))
+            damp = 1.0
+            while damp > self.MIN_DAMPING:
+                # an exp() overflow of a far too large Vd gives inf here
+                normNew = np.linalg.norm(
+                    self.residual(X + damp * dX, limit=False))
+                if normNew <= (1 - 1e-4 * damp) * normF:
+                    break
+                damp /= 2
+            # convergence is judged by the full Newton step
+            self.damping = damp
+            yield dX
+
+    def iterate(self, X, maxIter, strategy):
+        # Newton iterations from solution X, updated in place, taking
+        # steps by 'strategy'; returns whether they converged in maxIter.
+        # Diode voltages are limited against self.vdLimited, set by the
+        # caller
+        iterNum = 0
+        self.damping = 1.0
+        steps = getattr(self, STRATEGIES[strategy])(X)
+        converged = False
+        # a diode voltage so far off that exp() overflows gives inf (see
+        # solve()), or a singular Jacobian: both mean they diverged
+        try:
+            while iterNum < maxIter:
+                self.reportGuess(X)
+                (self.limitedBy, self.kclNorm) = (None, None)
+                times = [self.stats[key] for key in TIMES]
+                dX = next(steps)
+                # the generators keep a reference to X, so update it in
+                # place
+                X += self.damping * dX
+                iterNum += 1
+                converged = self.converged(dX, X)
+                if self.trace is not None:
+                    self.traceIteration(iterNum, dX, times, converged, X)
+                if converged or not np.all(np.isfinite(X)):
+                    break
+        except (RuntimeError, np.linalg.LinAlgError):
+            converged = False
+        self.stats['iterations'] += iterNum
+        return converged
+
+    def traceIteration(self, iterNum, dX, times, converged, X):
+        # append the record of an iteration to self.trace: the step taken,
+        # the KCL residual after it, and the seconds of each phase since
+        # 'times', the phase totals of self.stats before the iteration
+        step = np.abs(self.damping * dX[:self.ckt.N])
+        worst = int(np.argmax(step)) if len(step) else None
+        if self.kclNorm is None and np.all(np.isfinite(X)):
+            self.kclNorm = self.kclResidual(X)
+        record = {'strategy': self.stats['strategy'],
+                  'path': self.tracePath, 'point': self.tracePoint,
+                  'gshunt': self.gshunt, 'sourceScale': self.sourceScale,
+                  'iteration': iterNum,
+                  'maxDeltaV': float(step[worst]) if len(step) else 0.0,
+                  'maxDeltaNode': self.nodeNames[worst]
+                  if worst is not None else None,
+                  'residualNorm': self.kclNorm, 'damping': self.damping,
+                  'limitedBy': self.limitedBy, 'converged': bool(converged)}
+        for (key, before) in zip(TIMES, times):
+            record[key] = self.stats[key] - before
+        self.trace.append(record)
+
+    def gminStepping(self, strategy):
+        # Solve with a large gmin on every node first, which makes the
+        # circuit almost linear, then step gmin down to 0, each step from
+        # the solution of the one before. The step factor grows on every
+        # success and shrinks on a failure, which retries from the last
+        # solution.
+        self.gshunt = self.GMIN_START
+        X = self.initGuess()
+        if not self.iterate(X, self.STEP_MAX_ITER, strategy):
+            return None
+        (gmin, factor) = (self.GMIN_START, 10.0)
+        while gmin > 0:
+            # below mna.GMIN the next step goes to no gmin at all
+            self.gshunt = gmin / factor if gmin / factor > mna.GMIN else 0.0
+            trial = X.copy()
+            self.vdLimited = self.diodeVoltages(trial)
+            self.stats['continuationSteps'] += 1
+            if self.iterate(trial, self.STEP_MAX_ITER, strategy):
+                (X, gmin, factor) = (trial, self.gshunt, factor * 2)
+            else:
+                factor = np.sqrt(factor)
+                if factor - 1 < self.MIN_STEP:
+                    return None
+        return X
+
+    def sourceStepping(self, strategy):
+        # Ramp all independent sources up from 0, where every node is at
+        # 0V, to their full values, each step from the solution of the
+        # one before; the step doubles on every success, and is quartered
+        # on a failure, which retries from the last solution
+        X = np.zeros(self.size)
+        (scale, step) = (0.0, 0.1)
+        while scale < 1:
+            self.sourceScale = min(1.0, scale + step)
+            trial = X.copy()
+            self.vdLimited = self.diodeVoltages(trial)
+            self.stats['continuationSteps'] += 1
+            if self.iterate(trial, self.STEP_MAX_ITER, strategy):
+                (X, scale, step) = (trial, self.sourceScale, step * 2)
+            else:
+                step /= 4
+                if step < self.MIN_STEP:
+                    return None
+        return X
+
+    def coldStart(self, maxIter, strategy):
+        # Solution from the initial guess by plain Newton, or else by gmin
+        # or source stepping, unless continuation is turned off; None if
+        # none of them converged. The path taken is kept in self.stats.
+        self.tracePath = 'newton'
+        X = self.initGuess()
+        if self.iterate(X, maxIter, strategy):
+            self.stats['path'] = 'newton'
+            return X
+        if not self.continuation:
+            return None
+        for (path, method) in (('gmin', self.gminStepping),
+                               ('source', self.sourceStepping)):
+            self.tracePath = path
+            try:
+                X = method(strategy)
+            finally:
+                (self.gshunt, self.sourceScale) = (0.0, 1.0)
+            if X is not None:
+                self.stats['path'] = path
+                return X
+        return None
+
+    def newStats(self, strategy, trace=None):
+        # fresh statistics, and a fresh self.trace: a NewtonTrace of its
+        # own for trace=True, the given one, or None for no trace
+        (self.tracePath, self.tracePoint) = ('warm', None)
+        self.nodeNames = list(self.ckt.nodeDict.keys())
+        self.trace = NewtonTrace() if trace is True else trace
+        stats = {'strategy': strategy, 'iterations': 0, 'factorizations': 0,
+                 'continuationSteps': 0, 'path': None, 'converged': False}
+        stats.update((key, 0.0) for key in TIMES)
+        return stats
+
+    def solve(self, maxIter=100, strategy='full', trace=None):
+        """Run Newton iterations from the initial guess until converged,
+           taking steps by 'strategy', a key of STRATEGIES. If they do not
+           converge in maxIter, gmin stepping and then source stepping
+           are tried, unless continuation is turned off.
+           Returns (DCResult of the last iteration, number of iterations),
+           or (None, number of iterations) if not converged at all.
+           The path which converged ('newton', 'gmin', 'source' or None),
+           the numbers of iterations, continuation steps and Jacobian
+           factorizations, and the seconds taken, are kept in self.stats,
+           with the seconds of each phase (see TIMES). With trace=True, or
+           a NewtonTrace to add to, every iteration is recorded in
+           self.trace, which is self.stats['trace'] as well.
+        """
+        self.stats = self.newStats(strategy, trace)
+        self.stats['trace'] = self.trace
+        t0 = time.perf_counter()
+        # exp() of a far too large diode voltage overflows to inf, which
+        # is caught as divergence rather than warned about
+        with np.errstate(over='ignore', invalid='ignore'):
+            X = self.coldStart(maxIter, strategy)
+        converged = X is not None
+        self.stats.update(converged=converged,
+                          time=time.perf_counter() - t0)
+        return ((self.result(X) if converged else None),
+                self.stats['iterations'])
+
+    def sweep(self, sweeps=None, maxIter=100, strategy='full', trace=None):
+        """DC sweep of the circuit, returning an iccad_mna.DCSweepResult.
+           sweeps is a list of (source name, array of values) as in
+           iccad_mna.dc_sweep(), the first source varying fastest, or None
+           for the .dc card of the netlist. Each point starts from the
+           solution of the point before, which is only one source step
+           away, so it takes one or two iterations; a point that does not
+           converge so, e.g. the first one, is solved as by solve().
+           Points not converged at all are left NaN. The statistics of
+           all points are kept in self.stats, with the number of points
+           and of those started from scratch ('coldStarts'), and the
+           trace, as of solve(), tells the point of each iteration.
+        """
+        if sweeps is None:
+            sweeps = mna.dcCardSweeps(self.ckt)
+        sweepNames = [name.upper() for (name, values) in sweeps]
+        grids = np.meshgrid(*[np.asarray(values, dtype=float)
+                              for (name, values) in sweeps], indexing='ij')
+        sweepVals = np.column_stack([g.ravel(order='F') for g in grids])
+
+        # the RHS is linear in each source value, as in dc_sweep(); the
+        # branch rows of E sources have no source on them
+        (N, M) = (self.ckt.N, self.ckt.M)
+        units = [np.concatenate([mna.unitSourceRHS(self.ckt, name),
+                                 np.zeros(self.size - N - M)])
+                 for name in sweepNames]
+        nominal = [self.ckt.value[self.ckt.compDict[name]]
+                   for name in sweepNames]
+        baseZ = self.linearZ
+        solutions = np.full((len(sweepVals), self.size), np.nan)
+
+        self.stats = self.newStats(strategy, trace)
+        self.stats.update(points=len(sweepVals), coldStarts=0,
+                          trace=self.trace)
+        t0 = time.perf_counter()
+        X = None
+        try:
+            with np.errstate(over='ignore', invalid='ignore'):
+                for (k, vals) in enumerate(sweepVals):
+                    (self.tracePath, self.tracePoint) = ('warm', k)
+                    self.linearZ = baseZ.copy()
+                    for (unit, value, value0) in zip(units, vals, nominal):
+                        self.linearZ += (value - value0) * unit
+                    if X is not None:
+                        trial = X.copy()
+                        self.vdLimited = self.diodeVoltages(trial)
+                        X = trial if self.iterate(trial, maxIter,
+                                                  strategy) else None
+                    if X is None:
+                        self.stats['coldStarts'] += 1
+                        X = self.coldStart(maxIter, strategy)
+                    if X is not None:
+                        solutions[k] = X
+        finally:
+            self.linearZ = baseZ
+        self.stats.update(
+            converged=bool(np.all(np.isfinite(solutions[:, :N]))),
+            time=time.perf_counter() - t0)
+        return mna.DCSweepResult(sweepNames, sweepVals, solutions[:, :N],
+                                 solutions[:, N:], self.ckt.nodeDict,
+                                 self.vsrcDict)
+
+
+# Step strategies of Newton.solve(), by name, and their step generators
+STRATEGIES = {'full': 'fullSteps',
+              'modified': 'modifiedSteps',
+              'broyden': 'broydenSteps',
+              'linesearch': 'lineSearchSteps'}
+
+# Seconds spent in each phase of the iterations, as kept in Newton.stats:
+# evaluating the devices (residual), stamping the Jacobian, and factorizing
+# and solving it
+TIMES = ('evaluateTime', 'stampTime', 'solveTime')
+
+
+class NewtonTrace:
+    """Per-iteration records of Newton.solve() or Newton.sweep()
+       ---
+       + records is a list of dicts, one per iteration, in the order run:
+         path ('newton', 'gmin', 'source', or 'warm' for a start from an
+         earlier solution), point (the sweep point, or None), gshunt and
+         sourceScale of the continuation step, iteration (counting from 1
+         on each start), maxDeltaV and maxDeltaNode (the largest node
+         voltage change and its node), residualNorm (the largest KCL
+         residual after the step, A), damping, limitedBy (the diode most
+         limited by pnjlim, or None), converged, the seconds of TIMES,
+         and the strategy
+       + stream, if given, is a text file each record is written into as
+         a JSON line, as soon as it is made
+    """
+
+    def __init__(self, stream=None):
+        self.records = []
+        self.stream = stream
+
+    def append(self, record):
+        self.records.append(record)
+        if self.stream is not None:
+            self.stream.write(json.dumps(record) + "\n")
+
+    def __len__(self):
+        return len(self.records)
+
+    def column(self, key):
+        """Field 'key' of every record, as a NumPy array
+        """
+        return np.array([r[key] for r in self.records])
+
+    def writeJSONLines(self, fileName):
+        """Write all records into file fileName, one JSON line each
+        """
+        with open(fileName, 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+
+
+def phaseTimes(stats):
+    # the seconds of each phase of TIMES in stats, as text
+    return ", ".join("%s %.4fs" % (key[:-len('Time')], stats[key])
+                     for key in TIMES)
+
+
+def main():
+    """Command line entry: solve the DC operating point of a netlist file
+       by one or all Newton strategies
+    """
+    parser = argparse.ArgumentParser(
+        description='%(prog)s: DC operating point of a diode circuit by '
+                    "Newton's method")
+    parser.add_argument(
+        'netlist', nargs='?', help='input circuit file name')
+    parser.add_argument(
+        '-s', '--strategy', choices=list(STRATEGIES) + ['all'],
+        default='full',
+        help='Newton step strategy, or all of them to compare '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--dc', action='store_true',
+        help='run the .dc sweep card of the netlist, each point started '
+             'from the solution of the one before')
+    parser.add_argument(
+        '--maxiter', type=int, default=100,
+        help='iteration limit (default: %(default)s)')
+    parser.add_argument(
+        '--init-vd', type=float, default=None, metavar='VOLT',
+        help='initial guess of every diode voltage (default: its vcrit)')
+    parser.add_argument(
+        '--no-limit', action='store_true',
+        help='do not limit junction voltages by pnjlim')
+    parser.add_argument(
+        '--no-continuation', action='store_true',
+        help='give up when plain Newton fails, instead of trying gmin '
+             'and source stepping')
+    parser.add_argument(
+        '--current-tol', type=float, default=Newton.current_tolerance,
+        metavar='AMP',
+        help='KCL residual tolerance of every node, or 0 for no residual '
+             'check (default: %(default)g)')
+    parser.add_argument(
+        '--trace', metavar='FILE',
+        help='write a JSON line of every iteration into FILE')
+    parser.add_argument(
+        '-q', '--quiet', action='store_true',
+        help='do not print the guessed diode voltages of each iteration')
+    args = parser.parse_args()
+
+    littleNewton = Newton()
+    if args.netlist:
+        littleNewton.inputFileName = args.netlist
+        print("Input circuit file name for analyzing is: %s"
+              % (littleNewton.inputFileName))
+    else:
+        littleNewton.inputFile()
+    littleNewton.parseFile()
+    littleNewton.verbose = not args.quiet
+    littleNewton.init_diode_Vd = args.init_vd
+    littleNewton.limiting = not args.no_limit
+    littleNewton.continuation = not args.no_continuation
+    littleNewton.current_tolerance = args.current_tol or None
+    # one trace of all strategies or sweep points, streamed into the file
+    traceFile = open(args.trace, 'w') if args.trace else None
+    trace = NewtonTrace(traceFile) if traceFile else None
+    try:
+        runMain(littleNewton, args, trace)
+    finally:
+        if traceFile:
+            traceFile.close()
+
+
+def runMain(littleNewton, args, trace):
+    # the analysis of main() on the parsed Newton object littleNewton
+
+    if args.dc:
+        if mna.dcCardSweeps(littleNewton.ckt) is None:
+            print("No .dc card found in %s" % littleNewton.inputFileName,
+                  file=sys.stderr)
+            sys.exit(1)
+        strategy = 'full' if args.strategy == 'all' else args.strategy
+        res = littleNewton.sweep(maxIter=args.maxiter, strategy=strategy,
+                                 trace=trace)
+        stats = littleNewton.stats
+        print("%d points: %d iterations (%.2f per point), %d "
+              "factorizations, %d cold starts, %.4fs (%s)"
+              % (stats['points'], stats['iterations'],
+                 stats['iterations'] / max(stats['points'], 1),
+                 stats['factorizations'], stats['coldStarts'],
+                 stats['time'], phaseTimes(stats)), file=sys.stderr)
+        # one row per sweep point: source values, node voltages, and
+        # the currents of v-sources and E sources
+        print(*res.sweepNames, *res.nodeDict.keys(),
+              *["I(%s)" % name for name in res.vsrcDict], sep="\t")
+        for (vals, volts, amps) in zip(res.sweepVals, res.nodeVolt,
+                                       res.vsrcCurr):
+            print(*["%.6g" % x for x in vals],
+                  *["%.6f" % v for v in volts],
+                  *["%.6g" % a for a in amps[list(res.vsrcDict.values())]],
+                  sep="\t")
+        return
+
+    strategies = list(STRATEGIES) if args.strategy == 'all' \
+        else [args.strategy]
+    (report, result) = ([], None)
+    for strategy in strategies:
+        (res, iterNum) = littleNewton.solve(args.maxiter, strategy, trace)
+        report.append(littleNewton.stats)
+        if result is None:
+            # print the operating point of the first strategy converged
+            (result, resultIter) = (res, iterNum)
+    if len(report) > 1 or args.quiet:
+        for stats in report:
+            print("%-10s %s after %3d iterations, %3d factorizations, "
+                  "%.4fs (%s)" % (stats['strategy'],
+                                  "converged by %s" % stats['path']
+                                  if stats['converged'] else "NOT converged",
+                                  stats['iterations'],
+                                  stats['factorizations'], stats['time'],
+                                  phaseTimes(stats)))
+    if result is None:
         print("Not converged after too many iterations!")
         sys.exit(False)
+    print("Converged after", resultIter, "times.")
+    for node in result.nodeDict.keys():
+        print("node %s: %.6fV" % (node, result.voltage(node)))
+    for vsrc in result.vsrcDict.keys():
+        print("%s %s: %.6fA" % ("vcvs" if vsrc.startswith('E')
+                                else "vsource", vsrc, result.current(vsrc)))
+
 
-    # save this iteration's node voltage dictionary for next comparison
-    littleNewton.node_volt_iter0 = littleNewton.node_volt_iter1.copy()
-    littleNewton.node_volt_iter1 = {"0": 0,
-                                    "GND": 0}
+if __name__ == '__main__':
+    main()
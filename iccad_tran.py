@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""For demonstrating transient analysis (.tran) of a linear circuit of
+R, C, L elements and V/I sources with PULSE, PWL or SIN waveforms, based
+on the MNA matrix of iccad_mna.py. In time domain, the MNA equation reads
+    A * X + E * dX/dt = Z(t)
+where A and Z are stamped by stampTriplets() and E by stampReactive(),
+as in AC analysis. With a fixed time step h, it is integrated by
+  + backward Euler:  (A + E/h) * X1 = Z1 + E/h * X0
+  + trapezoidal:     (A + 2E/h) * X1 = Z1 + 2E/h * X0 + D0
+    where D = E * dX/dt is kept from step to step, D1 = 2E/h * (X1 - X0)
+    - D0, i.e. the companion current sources of capacitors and inductors
+Either way, the companion matrix on the left never changes, so it is
+factorized only once, and every time step is a forward/back substitution
+with a new right hand side. The sources are stamped once as well: the
+right hand side of each time point is a constant part plus the unit
+right hand side of each waveform source times its value then.
+The analysis starts from the DC operating point at time 0, where D is 0,
+or from all zero with UIC on the .tran card.
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+
+import iccad_mna as mna
+from spice_parse import spiceValue
+
+
+def waveformValues(waveform, times, tstep, tstop):
+    """Values of a source waveform (keyword, [values]) of spice_parse at
+       the time points 'times', with the SPICE defaults of the parameters
+       not given, some of which depend on the .tran card's tstep and tstop
+       ---
+       + PULSE(V1 V2 TD TR TF PW PER): V1 till TD, then ramps to V2 in TR,
+         stays there for PW, and back to V1 in TF, repeated every PER
+       + PWL(T1 V1 T2 V2 ...): linear between the points, held outside
+       + SIN(VO VA FREQ TD THETA PHASE): VO + VA * exp(-THETA * (t - TD))
+         * sin(2pi * (FREQ * (t - TD) + PHASE / 360)) from TD on
+    """
+    (keyword, values) = waveform
+    if keyword == 'PWL':
+        return np.interp(times, values[0::2], values[1::2])
+    if keyword == 'PULSE':
+        (v1, v2, td, tr, tf, pw, per) = (values + [0.0] * 7)[:7]
+        (tr, tf) = (tr or tstep, tf or tstep)
+        pw = pw or tstop
+        per = per or tstop
+        t = times - td
+        # time within the period; before TD, a point stays on V1
+        tm = np.where(t < 0, tr + pw + tf, np.mod(t, per))
+        return np.select([tm < tr, tm < tr + pw, tm < tr + pw + tf],
+                         [v1 + (v2 - v1) * tm / tr, v2,
+                          v2 + (v1 - v2) * (tm - tr - pw) / tf], v1)
+    if keyword == 'SIN':
+        (vo, va, freq, td, theta, phase) = (values + [0.0] * 6)[:6]
+        freq = freq or 1.0 / tstop
+        t = np.maximum(times - td, 0)
+        return vo + va * np.exp(-theta * t) \
+            * np.sin(2 * np.pi * (freq * t + phase / 360.0))
+    raise ValueError("unsupported waveform: %s" % keyword)
+
+
+def tranCard(ckt):
+    """(tstep, tstop, tstart, tmax, uic) given by the .tran card of Circuit
+       ckt, e.g. '.tran 1n 100n', '.tran 1n 100n 20n 0.5n UIC', or None
+       without any .tran card; a tmax not given is tstep
+    """
+    for card in ckt.controls:
+        if card[0] == '.TRAN':
+            uic = 'UIC' in card
+            fields = [spiceValue(f) for f in card[1:] if f != 'UIC']
+            (tstep, tstop) = fields[:2]
+            tstart = fields[2] if len(fields) > 2 else 0.0
+            tmax = fields[3] if len(fields) > 3 else tstep
+            return (tstep, tstop, tstart, tmax, uic)
+    return None
+
+
+class TranResult:
+    """Result of transient(), kept as NumPy arrays with one row per time
+       point
+       ---
+       + time[t] is the time (s) of point t
+       + nodeVolt[t, nodeDict[name]] is the voltage of node 'name', for
+         the nodes recorded
+       + vsrcCurr[t, vsrcDict[name]] is the current through v-source (or
+         inductor) 'name'
+       + stats holds the number of steps, the seconds of stamping,
+         factorizing and stepping, and the steps per second
+    """
+
+    def __init__(self, time, nodeVolt, vsrcCurr, nodeDict, vsrcDict):
+        self.time = time
+        self.nodeVolt = nodeVolt
+        self.vsrcCurr = vsrcCurr
+        self.nodeDict = nodeDict
+        self.vsrcDict = vsrcDict
+        self.stats = {}
+
+
+def transient(ckt, tstep, tstop, tstart=0.0, method='trap', uic=False,
+              nodes=None, ordering='amd'):
+    """Transient analysis of Circuit ckt from 0 to tstop by the fixed time
+       step tstep, integrated by 'method', 'trap' (trapezoidal) or 'be'
+       (backward Euler), returning a TranResult of the points from tstart
+       on. The analysis starts from the DC operating point at time 0, or
+       from all zero with uic=True. nodes lists the names of the nodes to
+       record, or None for all of them. ordering is the fill-reducing
+       ordering of the sparse LU, a key of iccad_mna.ORDERINGS; the
+       companion matrix of an RC network is symmetric, which a minimum
+       degree ordering of A + AT suits better than COLAMD.
+    """
+    if method not in ('trap', 'be'):
+        raise ValueError("unknown integration method: %s" % method)
+    t0 = time.perf_counter()
+    steps = int(np.floor(tstop / tstep + 1e-9))
+    times = tstep * np.arange(steps + 1)
+    (N, size) = (ckt.N, ckt.N + ckt.M)
+
+    # the sources with a waveform are left out of the constant right hand
+    # side, and added by their unit right hand sides U, times their values
+    # W at each time point
+    names = list(ckt.waveforms)
+    value = ckt.value.copy()
+    value[[ckt.compDict[name] for name in names]] = 0
+    (rowA, colA, valA, baseZ) = mna.stampTriplets(ckt, value)
+    (rowE, colE, valE) = mna.stampReactive(ckt)
+    U = np.zeros((size, len(names)))
+    W = np.zeros((steps + 1, len(names)))
+    for (k, name) in enumerate(names):
+        U[:, k] = mna.unitSourceRHS(ckt, name)
+        W[:, k] = waveformValues(ckt.waveforms[name], times, tstep, tstop)
+    if mna.sp is None:
+        E = np.zeros([size, size])
+        np.add.at(E, (rowE, colE), valE)
+    else:
+        U = mna.sp.csr_matrix(U)
+        E = mna.sp.csr_matrix((valE, (rowE, colE)), shape=(size, size))
+    t1 = time.perf_counter()
+
+    # the companion matrix A + c * E, factorized once for all the steps
+    c = 2.0 / tstep if method == 'trap' else 1.0 / tstep
+    factor = mna.LUFactor(size, np.concatenate([rowA, rowE]),
+                          np.concatenate([colA, colE]),
+                          np.concatenate([valA, c * valE]), ordering=ordering)
+    if uic:
+        X = np.zeros(size)
+    else:
+        X = mna.LUFactor(size, rowA, colA, valA,
+                         ordering=ordering).solve(baseZ + U.dot(W[0]))
+    t2 = time.perf_counter()
+
+    columns = np.arange(N) if nodes is None \
+        else np.array([ckt.nodeDict[n.upper()] for n in nodes],
+                      dtype=np.int64)
+    keep = times >= tstart - 1e-9 * tstep
+    first = int(np.argmax(keep))
+    nodeVolt = np.empty((steps + 1 - first, len(columns)))
+    vsrcCurr = np.empty((steps + 1 - first, ckt.M))
+    if first == 0:
+        (nodeVolt[0], vsrcCurr[0]) = (X[columns], X[N:])
+    D = np.zeros(size)  # E * dX/dt, which is 0 at a DC operating point
+    for n in range(1, steps + 1):
+        rhs = baseZ + U.dot(W[n]) + c * E.dot(X)
+        if method == 'trap':
+            X1 = factor.solve(rhs + D)
+            D = c * E.dot(X1 - X) - D
+            X = X1
+        else:
+            X = factor.solve(rhs)
+        if n >= first:
+            (nodeVolt[n - first], vsrcCurr[n - first]) = (X[columns], X[N:])
+    t3 = time.perf_counter()
+
+    allNodes = list(ckt.nodeDict.keys())
+    nodeDict = {allNodes[i]: k for (k, i) in enumerate(columns)}
+    res = TranResult(times[first:], nodeVolt, vsrcCurr, nodeDict,
+                     ckt.vsrcDict)
+    res.stats = {'steps': steps, 'stamp': t1 - t0, 'factor': t2 - t1,
+                 'stepping': t3 - t2,
+                 'stepsPerSecond': steps / (t3 - t2) if t3 > t2 else np.inf}
+    return res
+
+
+def main():
+    """Command line entry: transient analysis of a netlist file by its
+       .tran card
+    """
+    parser = argparse.ArgumentParser(
+        description='%(prog)s: transient analysis of a linear circuit')
+    parser.add_argument(
+        'netlist', help='input circuit file name')
+    parser.add_argument(
+        '-m', '--method', choices=['trap', 'be'], default='trap',
+        help='integration method, trapezoidal or backward Euler '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--step', type=lambda text: spiceValue(text.upper()), default=None,
+        help='fixed time step (default: the smaller of tstep and tmax of '
+             'the .tran card)')
+    parser.add_argument(
+        '--ordering', choices=list(mna.ORDERINGS), default='amd',
+        help='fill-reducing ordering of the sparse LU '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '-n', '--nodes', nargs='+', metavar='NODE',
+        help='nodes to print (default: all nodes)')
+    args = parser.parse_args()
+
+    ckt = mna.Circuit.fromFile(args.netlist)
+    card = tranCard(ckt)
+    if card is None:
+        print("No .tran card found in %s" % args.netlist, file=sys.stderr)
+        sys.exit(1)
+    (tstep, tstop, tstart, tmax, uic) = card
+    step = args.step or min(tstep, tmax)
+
+    res = transient(ckt, step, tstop, tstart, args.method, uic, args.nodes,
+                    args.ordering)
+    stats = res.stats
+    print("%d steps: stamp %.4fs, factor %.4fs, steps %.4fs (%.0f steps/s)"
+          % (stats['steps'], stats['stamp'], stats['factor'],
+             stats['stepping'], stats['stepsPerSecond']), file=sys.stderr)
+
+    # one row per time point: node voltages, and v-source currents
+    nodes = list(res.nodeDict.keys())
+    print("TIME", *["V(%s)" % n for n in nodes],
+          *["I(%s)" % name for name in res.vsrcDict], sep="\t")
+    for (t, volts, amps) in zip(res.time, res.nodeVolt, res.vsrcCurr):
+        print("%.6g" % t, *["%.6g" % v for v in volts],
+              *["%.6g" % a for a in amps[list(res.vsrcDict.values())]],
+              sep="\t")
+
+
+if __name__ == '__main__':
+    main()
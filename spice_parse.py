@@ -0,0 +1,488 @@
+#!/usr/bin/env python
+"""A small SPICE netlist parser shared by the circuit simulation demos
+(iccad_mna.py, iccad_newton.py and the programs importing them).
+The netlist is read line by line, never as a whole, and each node name
+is numbered the first time it is met by a dictionary lookup, so that
+netlists of millions of lines are parsed in seconds with bounded memory.
+Component fields are collected into compact typed arrays, which become
+the struct-of-arrays tables of the circuit.
+Supported syntax:
+  + the first line of a netlist file as its title, as SPICE does
+  + comment lines beginning with '*' or '#', blank lines, and in-line
+    comments after ';' or '$'
+  + continuation lines beginning with '+'
+  + engineering suffixes of values, e.g. 10K, 30fF, 0.01NS, 2MEG
+  + .param name=value definitions referenced as {name}
+  + complex impedance values of Z elements, e.g. -100J or 3+4J
+  + 'DC value' and 'AC magnitude [phase]' fields of V/I sources, and
+    their PULSE(...), PWL(...) or SIN(...) transient waveforms
+  + .subckt definitions, possibly nested, and X instances of them
+  + .model cards, e.g. '.model D1N4148 D (IS=2.52N N=1.752)'
+"""
+
+import sys
+import re
+from array import array
+import numpy as np
+
+
+def isnotGround(node_name):
+    """Is the node_name not an alias of Ground?
+    """
+    return bool(node_name not in ('0', 'GND'))
+
+
+# Component kinds in the struct-of-arrays component tables;
+# the kind is decided by the first letter of a component name
+KIND_R = 0  # resistor
+KIND_I = 1  # independent current source
+KIND_V = 2  # independent voltage source
+KIND_C = 3  # capacitor
+KIND_L = 4  # inductor
+KIND_Z = 5  # fixed (complex) impedance
+KIND_CODE = {'R': KIND_R, 'I': KIND_I, 'V': KIND_V,
+             'C': KIND_C, 'L': KIND_L, 'Z': KIND_Z}
+
+# SPICE scale factors, matched after the number and before any unit
+# letters; e.g. 30FF is 30 femto-Farad, 0.01NS is 0.01 nano-second.
+# Note that M is milli, and mega has to be written as MEG.
+SUFFIX_SCALE = {
+    'T': 1e12, 'G': 1e9, 'MEG': 1e6, 'K': 1e3, 'MIL': 25.4e-6,
+    'M': 1e-3, 'U': 1e-6, 'N': 1e-9, 'P': 1e-12, 'F': 1e-15,
+}
+# Transient waveforms of V/I sources, by the keyword starting them
+WAVEFORMS = ('PULSE', 'PWL', 'SIN')
+VALUE_PATTERN = re.compile(
+    r'([+-]?(?:\d+\.?\d*|\.\d+)(?:E[+-]?\d+)?)(MEG|MIL|[TGKMUNPF])?'
+    r'(?!E)[A-Z]*$')
+
+
+def spiceValue(text, params=None):
+    """Convert a SPICE value text (upper-cased) into a float, e.g.
+       '10K' -> 1e4, '30FF' -> 3e-14, '0.01NS' -> 1e-11, '1.1V' -> 1.1.
+       A '{name}' text is looked up in the params dictionary, and a text
+       ending with J is an imaginary or complex number, e.g. '-100J'.
+       ValueError is raised for anything else.
+    """
+    try:
+        return float(text)  # the fast path for plain numbers
+    except ValueError:
+        pass
+    if text.endswith('J'):
+        return complex(text.replace('J', 'j'))
+    if text.startswith('{') and text.endswith('}') and params is not None:
+        # only plain names are supported, not expressions like {2*a}
+        if text[1:-1] not in params:
+            raise ValueError("unknown or unsupported parameter: '%s'"
+                             % text)
+        return params[text[1:-1]]
+    m = VALUE_PATTERN.match(text)
+    if m is None:
+        raise ValueError("could not convert SPICE value: '%s'" % text)
+    value = float(m.group(1))
+    if m.group(2):
+        value *= SUFFIX_SCALE[m.group(2)]
+    return value
+
+
+def isValue(text, params=None):
+    """Can text be converted by spiceValue()?
+    """
+    try:
+        spiceValue(text, params)
+    except ValueError:
+        return False
+    return True
+
+
+def netlistCards(lines):
+    """Generator of the logical cards of a netlist, each as a list of
+       upper-cased words. Comments are dropped and continuation lines
+       ('+' in the first column) are joined to the card before them.
+       Only the card being assembled is held in memory.
+    """
+    card = []
+    for line in lines:
+        line = line.upper()
+        # in-line comments, as ngspice and HSPICE accept
+        if ';' in line or '$' in line:
+            line = re.split(r'[;$]', line, maxsplit=1)[0]
+        wl = line.split()
+        if not wl or wl[0].startswith(('*', '#')):
+            continue
+        if wl[0].startswith('+'):
+            wl[0] = wl[0][1:]
+            card.extend(w for w in wl if w)
+            continue
+        if card:
+            yield card
+        card = wl
+    if card:
+        yield card
+
+
+class Netlist:
+    """Parse result of a netlist: the struct-of-arrays tables of linear
+       components, the node numbering, and the dot cards.
+       ---
+       + names/kind/pIdx/nIdx/value are the component tables, where
+         pIdx/nIdx hold node numbers and -1 stands for ground
+       + nodeDict maps node names to numbers, given in order of appearance
+       + acValues maps table rows of sources with an AC field to their
+         complex AC excitation; complex values of Z elements are kept
+         apart from the real value table in the same way
+       + waveforms maps table rows of sources with a transient waveform
+         to (keyword, [values]), e.g. ('PULSE', [0, 1, 1e-9, ...])
+       + params holds .param values, controls holds other dot cards
+       + models maps .model names to (type, {parameter: value}); values
+         not read by spiceValue(), e.g. VERSION=4.8.0, are kept as text
+       + subckts maps .subckt names to Subckt definitions, and instances
+         lists the X cards as (name, node numbers, subckt name), until
+         expandInstances() appends their components into the tables
+       + title is the first line of a netlist file
+    """
+
+    def __init__(self):
+        self.title = ""
+        self.names = []
+        # array.array keeps 1-8 bytes per entry, unlike a list of objects
+        self._kind = array('b')
+        self._pIdx = array('q')
+        self._nIdx = array('q')
+        self._value = array('d')
+        self._complexValues = {}
+        self.acValues = {}
+        self.waveforms = {}
+        self.nodeDict = {}
+        # nodeDict plus ground aliases, for a single lookup per node
+        self._nodeNumber = {'0': -1, 'GND': -1}
+        self.params = {}
+        self.controls = []
+        self.models = {}
+        self.subckts = {}
+        self.instances = []
+        self._subckt = None  # the Subckt being defined, if any
+        self._inControl = False
+
+    def nodeIndex(self, node):
+        """Number of a node name, which is given at its first appearance
+        """
+        # 0/GND are treated as the same node, not appearing in matrix
+        index = self._nodeNumber.get(node)
+        if index is None:
+            index = self._nodeNumber[node] = self.nodeDict[node] = \
+                len(self.nodeDict)
+        return index
+
+    def addComponent(self, name, kind, pNode, nNode, value):
+        """Append one 2-terminal component into the tables
+        """
+        nodeIndex = self.nodeIndex
+        self.names.append(name)
+        self._kind.append(kind)
+        self._pIdx.append(nodeIndex(pNode))
+        self._nIdx.append(nodeIndex(nNode))
+        if isinstance(value, complex):
+            self._complexValues[len(self._value)] = value
+            value = value.real
+        self._value.append(value)
+
+    def parseSourceSpec(self, fields):
+        """Parse the fields after the nodes of a V/I source card, e.g.
+           '5', 'DC 5', 'DC=5', 'DC 0 AC 1', 'AC 1 90', '0 PULSE(...)'
+           or just 'PULSE(...)', where the DC value defaults to 0.
+           Returns (DC value, complex AC value or None, transient waveform
+           as (keyword, [values]) or None).
+        """
+        dcValue = 0.0
+        acValue = None
+        waveform = None
+        i = 0
+        while i < len(fields):
+            if fields[i].startswith('DC='):  # e.g. 'DC=5'
+                dcValue = spiceValue(fields[i][3:], self.params)
+                i += 1
+            elif fields[i] == 'DC' and i + 1 < len(fields):
+                dcValue = spiceValue(fields[i + 1], self.params)
+                i += 2
+            elif fields[i] == 'AC':
+                magnitude = 1.0
+                phase = 0.0
+                i += 1
+                for k in range(2):  # optional magnitude, then phase
+                    try:
+                        number = spiceValue(fields[i], self.params)
+                    except (ValueError, IndexError):
+                        break
+                    if k == 0:
+                        magnitude = number
+                    else:
+                        phase = number
+                    i += 1
+                acValue = complex(magnitude
+                                  * np.exp(1j * np.deg2rad(phase)))
+            elif i == 0 and isValue(fields[0], self.params):
+                dcValue = spiceValue(fields[0], self.params)
+                i += 1
+            elif fields[i].split('(')[0] in WAVEFORMS:
+                # e.g. 'PULSE(0', '1', ..., '10N)' or 'PWL', '(0', '0', ...
+                # up to the closing parenthesis
+                end = i
+                while end < len(fields) - 1 and ')' not in fields[end]:
+                    end += 1
+                text = " ".join(fields[i:end + 1])
+                words = re.sub(r'[(),]', ' ', text).split()
+                waveform = (words[0], [spiceValue(w, self.params)
+                                       for w in words[1:]])
+                i = end + 1
+            else:  # other fields are not supported and thus ignored
+                break
+        return (dcValue, acValue, waveform)
+
+    def parseCard(self, wl):
+        """Add one card (a list of upper-cased words) into the netlist
+        """
+        # ngspice .control ... .endc blocks hold interpreter commands,
+        # e.g. 'let pv1 = ...', which must not be read as components
+        if self._inControl:
+            if wl[0] == '.ENDC':
+                self._inControl = False
+            return
+        if wl[0] == '.CONTROL':
+            self._inControl = True
+            return
+        if self._subckt is not None:
+            # cards of a .SUBCKT body go into the body's own netlist,
+            # until the .ENDS closing it (not one of a nested definition)
+            if wl[0] == '.ENDS' and self._subckt.body._subckt is None:
+                self._subckt = None
+            else:
+                self._subckt.body.parseCard(wl)
+            return
+        if wl[0] == '.SUBCKT':
+            # .SUBCKT name port1 port2 ..., any 'name=value' ignored
+            ports = [w for w in wl[2:] if '=' not in w]
+            self._subckt = self.subckts[wl[1]] = Subckt(
+                wl[1], ports, self.params, self.subckts)
+            return
+        if wl[0] == '.PARAM':
+            # .PARAM a=1 b = 2K, with or without blanks around '='
+            for (name, text) in re.findall(r'(\w+)\s*=\s*(\S+)',
+                                           " ".join(wl[1:])):
+                self.params[name] = spiceValue(text, self.params)
+        elif wl[0] == '.MODEL' and len(wl) >= 3:
+            self.models[wl[1]] = parseModel(wl[2:], self.params)
+            self.controls.append(wl)
+        elif wl[0].startswith('.'):
+            self.controls.append(wl)
+        elif wl[0][0] == 'X':
+            # X name node1 node2 ... subckt, any 'name=value' ignored
+            fields = [w for w in wl[1:] if '=' not in w]
+            self.instances.append(
+                (wl[0], [self.nodeIndex(n) for n in fields[:-1]],
+                 fields[-1]))
+        elif wl[0][0] in ('V', 'I') and len(wl) >= 4:
+            (dcValue, acValue, waveform) = self.parseSourceSpec(wl[3:])
+            if acValue is not None:
+                self.acValues[len(self.names)] = acValue
+            if waveform is not None:
+                self.waveforms[len(self.names)] = waveform
+            self.addComponent(wl[0], KIND_CODE[wl[0][0]], wl[1], wl[2],
+                              dcValue)
+        elif wl[0][0] in KIND_CODE and len(wl) >= 4:
+            self.addComponent(wl[0], KIND_CODE[wl[0][0]], wl[1], wl[2],
+                              spiceValue(wl[3], self.params))
+        # other cards are not supported and thus ignored
+
+    def tables(self):
+        """Component tables as NumPy arrays:
+           (names, kind, pIdx, nIdx, value)
+           The value array is complex only if any complex value is met.
+        """
+        value = np.frombuffer(self._value, dtype=float).copy()
+        if self._complexValues:
+            value = value.astype(complex)
+            rows = list(self._complexValues.keys())
+            value[rows] = list(self._complexValues.values())
+        return (self.names,
+                np.frombuffer(self._kind, dtype=np.int8).copy(),
+                np.frombuffer(self._pIdx, dtype=np.int64).copy(),
+                np.frombuffer(self._nIdx, dtype=np.int64).copy(),
+                value)
+
+    def flatTables(self, instances=None):
+        """Component tables as tables(), with all X instances (or those
+           in 'instances', a part of self.instances) expanded,
+           together with the names of the nodes inside the instances, and
+           the AC values and transient waveforms of the expanded tables:
+           (names, kind, pIdx, nIdx, value, instance node names, acValues,
+            waveforms)
+           Instance nodes are numbered after all nodes of nodeDict, and
+           the components and nodes of instance X1 are named X1.R1,
+           X1.NET1, and so on.
+           The instances of one subckt are expanded together: the flat
+           tables of the subckt, built once, are laid out in node numbers
+           local to it, i.e. ports first, then internal nodes, so each
+           instance just maps them through an array of its own numbers.
+        """
+        (names, kind, pIdx, nIdx, value) = self.tables()
+        (kinds, pIdxs, nIdxs, values) = ([kind], [pIdx], [nIdx], [value])
+        acValues = dict(self.acValues)
+        waveforms = dict(self.waveforms)
+        nodeNames = []
+        count = len(self.nodeDict)
+        names = list(names)
+
+        if instances is None:
+            instances = self.instances
+        bySubckt = {}
+        for (instName, nodes, subName) in instances:
+            bySubckt.setdefault(subName, []).append((instName, nodes))
+        for (subName, instances) in bySubckt.items():
+            if subName not in self.subckts:
+                raise ValueError("unknown subcircuit: %s" % subName)
+            subckt = self.subckts[subName]
+            cell = subckt.flat()
+            (cellNames, cellKind, cellP, cellN, cellValue, cellNodes,
+             cellAC, cellWaveforms) = cell
+            P = len(subckt.ports)
+            I = len(cellNodes)  # local nodes after the ports
+            K = len(instances)
+            for (instName, nodes) in instances:
+                if len(nodes) != P:
+                    raise ValueError("%s: %d nodes for %d ports of %s"
+                                     % (instName, len(nodes), P, subName))
+
+            # row k maps local node numbers of instance k to numbers of
+            # this netlist; the last column turns ground (-1) into -1
+            nodeMap = np.empty((K, P + I + 1), dtype=np.int64)
+            nodeMap[:, :P] = [nodes for (instName, nodes) in instances]
+            nodeMap[:, P:P + I] = (count + I * np.arange(K)[:, np.newaxis]
+                                   + np.arange(I))
+            nodeMap[:, -1] = -1
+            count += K * I
+            instNames = [instName for (instName, nodes) in instances]
+
+            for (rows, cellRows) in ((acValues, cellAC),
+                                     (waveforms, cellWaveforms)):
+                for (row, spec) in cellRows.items():
+                    for k in range(K):
+                        rows[len(names) + k * len(cellNames) + row] = spec
+            names += [inst + "." + name
+                      for inst in instNames for name in cellNames]
+            nodeNames += [inst + "." + node
+                          for inst in instNames for node in cellNodes]
+            kinds.append(np.tile(cellKind, K))
+            pIdxs.append(nodeMap[:, cellP].ravel())
+            nIdxs.append(nodeMap[:, cellN].ravel())
+            values.append(np.tile(cellValue, K))
+
+        return (names, np.concatenate(kinds), np.concatenate(pIdxs),
+                np.concatenate(nIdxs), np.concatenate(values), nodeNames,
+                acValues, waveforms)
+
+    def expandInstances(self, keep=()):
+        """Replace the X instances by their components, which are put
+           into the tables, and their nodes, which are put into nodeDict.
+           Instances of the subckts named in keep are left in instances.
+        """
+        expand = [inst for inst in self.instances if inst[2] not in keep]
+        self.instances = [inst for inst in self.instances
+                          if inst[2] in keep]
+        if not expand:
+            return
+        (names, kind, pIdx, nIdx, value, nodeNames, self.acValues,
+         self.waveforms) = self.flatTables(expand)
+        for node in nodeNames:
+            self._nodeNumber[node] = self.nodeDict[node] = len(self.nodeDict)
+        self.names = names
+        self._kind = array('b', kind.tobytes())
+        self._pIdx = array('q', pIdx.tobytes())
+        self._nIdx = array('q', nIdx.tobytes())
+        self._value = array('d', value.real.tobytes())
+        self._complexValues = {int(i): complex(value[i])
+                               for i in np.flatnonzero(np.imag(value))}
+
+
+class Subckt:
+    """A .SUBCKT definition: its ports and a netlist of its body, where
+       the ports are numbered first, as local nodes 0 .. P-1. Subckt
+       definitions and .param values are shared with the netlist the
+       subckt is defined in, so nested instances are found by name.
+       flat() gives the flat tables of the body once, for all instances.
+    """
+
+    def __init__(self, name, ports, params, subckts):
+        self.name = name
+        self.ports = ports
+        self.body = Netlist()
+        self.body.params = params
+        self.body.subckts = subckts
+        for port in ports:
+            self.body.nodeIndex(port)
+        self._flat = None
+        self._flattening = False
+
+    def flat(self):
+        """flatTables() of the body, in local node numbers, where the
+           node names are those of the local nodes after the ports
+        """
+        if self._flat is None:
+            if self._flattening:
+                raise ValueError("subcircuit %s instantiates itself"
+                                 % self.name)
+            self._flattening = True
+            (names, kind, pIdx, nIdx, value, nodeNames, acValues,
+             waveforms) = self.body.flatTables()
+            self._flattening = False
+            internal = list(self.body.nodeDict.keys())[len(self.ports):]
+            self._flat = (names, kind, pIdx, nIdx, value,
+                          internal + nodeNames, acValues, waveforms)
+        return self._flat
+
+
+def parseModel(fields, params=None):
+    """(type, {parameter: value}) of the fields of a .model card after its
+       name, e.g. ['D', '(IS=2.52N', 'N', '=', '1.752)'], with or without
+       parentheses and blanks around '='
+    """
+    text = " ".join(fields).replace('(', ' ').replace(')', ' ')
+    words = text.split()
+    values = {}
+    for (name, value) in re.findall(r'(\w+)\s*=\s*([^\s=]+)', text):
+        values[name] = spiceValue(value, params) \
+            if isValue(value, params) else value
+    return (words[0] if words else "", values)
+
+
+def parseNetlist(lines, keep=()):
+    """Parse netlist lines (any iterable of strings, e.g. an opened file
+       or a list of cards built in memory) into a Netlist. X instances
+       are expanded, except those of the subckts named in keep.
+    """
+    netlist = Netlist()
+    for wl in netlistCards(lines):
+        netlist.parseCard(wl)
+    netlist.expandInstances(keep)
+    return netlist
+
+
+def parseFile(fileName, keep=()):
+    """Read in and parse a netlist file into a Netlist, line by line.
+       As in SPICE, the first line of a file is always the title, even if
+       it reads like a component, e.g. 'Ring Oscillator made of ...'.
+       keep is passed on to parseNetlist().
+    """
+    with open(fileName) as f:
+        title = f.readline().strip()
+        netlist = parseNetlist(f, keep)
+    netlist.title = title
+    return netlist
+
+
+if __name__ == '__main__':
+    # Parse a netlist given in command line and report its size
+    for fName in sys.argv[1:]:
+        nl = parseFile(fName)
+        print("%s: %d components, %d nodes, %d dot cards"
+              % (fName, len(nl.names), len(nl.nodeDict), len(nl.controls)))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""The program checks the what-if (ECO) solver IncrementalDC of
+iccad_mna.py (in the parent directory) against a fresh solve_dc() of
+the same circuit after each change:
+  + a few resistor changes, solved by low-rank (Woodbury) updates
+  + source-only changes, which touch the right hand side only
+  + more resistor changes than maxRank, falling back to a refactor
+  + a rejected change, which must leave the solver untouched
+Both the dense (cube.spice) and the sparse path (a resistor mesh built
+in memory) are checked. It prints the worst voltage error of each step
+and exits with status 1 on any mismatch.
+"""
+
+import sys
+import os
+import numpy as np
+
+# iccad_mna.py lives in the parent directory of this program
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, os.pardir))
+import iccad_mna as mna
+
+TOLERANCE = 1e-9
+
+
+def meshLines(size):
+    """Netlist lines of a size x size mesh of 1-Ohm resistors, fed by a
+       1V source at one corner and a 1mA load at the opposite corner
+    """
+    lines = []
+    for i in range(size):
+        for j in range(size):
+            if j + 1 < size:
+                lines.append("RH_%d_%d N_%d_%d N_%d_%d 1"
+                             % (i, j, i, j, i, j + 1))
+            if i + 1 < size:
+                lines.append("RV_%d_%d N_%d_%d N_%d_%d 1"
+                             % (i, j, i, j, i + 1, j))
+    lines.append("V1 N_0_0 0 1")
+    lines.append("I1 N_%d_%d 0 1M" % (size - 1, size - 1))
+    return lines
+
+
+failed = False
+
+
+def check(label, eco, res):
+    """Compare DCResult res of eco against a fresh solve_dc()
+    """
+    global failed
+    ref = mna.solve_dc(eco.ckt)
+    err = max(np.max(np.abs(res.nodeVolt - ref.nodeVolt)),
+              np.max(np.abs(res.vsrcCurr - ref.vsrcCurr)))
+    ok = err <= TOLERANCE
+    failed = failed or not ok
+    print("%-40s rank %2d refactors %d error %.3e %s"
+          % (label, eco.rank, eco.refactorCount, err,
+             "ok" if ok else "MISMATCH"))
+
+
+def checkCircuit(title, ckt, resistors, sources):
+    global failed
+    print(title)
+    eco = mna.IncrementalDC(ckt)
+    rng = np.random.default_rng(1)
+
+    # a few resistors, then the same ones again with other values
+    few = resistors[:3]
+    check("3 resistors", eco,
+          eco.update({r: v for (r, v) in zip(few, rng.uniform(0.5, 2, 3))}))
+    check("3 resistors again", eco,
+          eco.update({r: v for (r, v) in zip(few, rng.uniform(0.5, 2, 3))}))
+
+    # source changes alone keep the rank of the resistor changes
+    check("sources only", eco,
+          eco.update({s: v for (s, v) in
+                      zip(sources, rng.uniform(-2, 2, len(sources)))}))
+
+    # resistors and a source in one update
+    check("resistor and source", eco,
+          eco.update({resistors[3]: 3.0, sources[0]: 0.5}))
+
+    # more changed resistors than maxRank refactorizes
+    if len(resistors) > eco.maxRank:
+        refactors = eco.refactorCount
+        many = resistors[:eco.maxRank + 1]
+        res = eco.update({r: v for (r, v) in
+                          zip(many, rng.uniform(0.5, 2, len(many)))})
+        check("%d resistors (past maxRank)" % len(many), eco, res)
+        if eco.refactorCount != refactors + 1:
+            print("  expected a refactor past maxRank")
+            failed = True
+        # right after a refactor no resistor differs: a pure RHS update
+        check("sources only, rank 0", eco, eco.update({sources[0]: 0.25}))
+
+    # a change of an unknown element is rejected before any is applied
+    before = eco.ckt.value.copy()
+    try:
+        eco.update({resistors[0]: 5.0, "NO_SUCH_ELEMENT": 1.0})
+    except KeyError:
+        pass
+    if not np.array_equal(before, eco.ckt.value):
+        print("  rejected update changed the circuit")
+        failed = True
+    check("after rejected update", eco, eco.result())
+
+
+checkCircuit("cube.spice (dense path)",
+             mna.Circuit.fromFile(os.path.join(here, "cube.spice")),
+             ["RU12", "RD23", "RV4", "RU34"], ["V1"])
+checkCircuit("12x12 mesh (sparse path)",
+             mna.Circuit.fromLines(meshLines(12)),
+             ["RH_%d_%d" % (i, j) for i in range(10) for j in range(5)],
+             ["V1", "I1"])
+
+sys.exit(1 if failed else 0)
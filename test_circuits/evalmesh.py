@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 """The program reads in a binary image of metal jog, down-samples
 the image and discretizes the metal strip into a mesh of resistors.
-Then it calls a DC simulator to analyze mesh node voltages and
+Then it calls a DC simulator (iccad_mna.py in the parent directory,
+imported in-process) to analyze mesh node voltages and
 from the voltage outputs calculates current out-flowing from each node.
 A mesh voltage graph and a mesh current density graph are then plotted.
 """
@@ -9,11 +10,15 @@ A mesh voltage graph and a mesh current density graph are then plotted.
 import sys
 import math
 import os
-import re
 import numpy
 from PIL import Image
 import matplotlib.pyplot as plt
 
+# iccad_mna.py lives in the parent directory of this program
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir))
+import iccad_mna as mna
+
 # I drew two images by GIMP, but other image tool should be fine
 image = Image.open('metal-jog.png')
 #image = Image.open('metal-slot.bmp')
@@ -76,26 +81,19 @@ for j in range(mesh_ysize):
 f.close()
 
 # run circuit simulator (SPICE) for all node voltages
-ret_code = os.system("python ../iccad_mna.py resmesh.spice > meshvolt.out")
-if ret_code != 0:
-    sys.exit(ret_code)
+result = mna.solve_dc(mna.Circuit.fromFile("./resmesh.spice"))
 
-# after running SPICE, read back SPICE outputs and sum the out-flowing
-# currents from each node and plot this sum (current densities) to
-# another image.
+# after running SPICE, take the node voltages from its result arrays and
+# sum the out-flowing currents from each node and plot this sum (current
+# densities) to another image.
 
-# read file meshvolt.out, then match SPICE outputs using Regular Expressions
+# node names are upper-cased by the simulator, N_i_j is on row j column i
 meshVolt = numpy.zeros([mesh_ysize, mesh_xsize])
-with open("./meshvolt.out") as fmv:
-    for line in fmv.readlines():
-        if re.match(r'^node N_\d+_\d+', line):
-            node_args = re.split(' ', line)
-            nl = re.findall(r'\d+', node_args[1])
-            volt = re.search(r'[^V]+', node_args[2])
-            meshVolt[int(nl[1])][int(nl[0])] = volt.group()
-
-# 'with' automatically takes care of closing file after its block
-# fmv.close()
+for j in range(mesh_ysize):
+    for i in range(mesh_xsize):
+        n_index = result.nodeDict.get("N_%d_%d" % (i, j))
+        if n_index is not None:
+            meshVolt[j][i] = result.nodeVolt[n_index]
 
 
 plt.subplot(211)